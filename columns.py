@@ -0,0 +1,103 @@
+# Columnar view of the numeric fields of parsed entries.
+#
+# Entries are Python objects, so counting or filtering them walks every object in the
+# interpreter. A Columns instance copies the numeric fields listed by a module (columnFields)
+# and per-language has-translation flags into arrays once after parsing. Filters providing a
+# mask() method and translation statistics then run as vectorised operations. NumPy is used
+# when available and the array module otherwise; the functions below hide the difference.
+
+import array
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+def intColumn(values):
+	if numpy is not None: return numpy.array(values, dtype = numpy.int64)
+	return array.array('q', values)
+
+def boolColumn(values):
+	if numpy is not None: return numpy.array(values, dtype = numpy.bool_)
+	return array.array('b', values)
+
+def full(n, value):
+	if numpy is not None: return numpy.full(n, value, dtype = numpy.bool_)
+	return array.array('b', [ value ]) * n
+
+def gt(col, value):
+	if numpy is not None: return col > value
+	return array.array('b', [ x > value for x in col ])
+
+def le(col, value):
+	if numpy is not None: return col <= value
+	return array.array('b', [ x <= value for x in col ])
+
+def eq(col, value):
+	if numpy is not None: return col == value
+	return array.array('b', [ x == value for x in col ])
+
+def isin(col, values):
+	if numpy is not None: return numpy.isin(col, numpy.array(list(values), dtype = numpy.int64))
+	values = set(values)
+	return array.array('b', [ x in values for x in col ])
+
+def logicalAnd(a, b):
+	if numpy is not None: return a & b
+	return array.array('b', [ x and y for x, y in zip(a, b) ])
+
+def logicalOr(a, b):
+	if numpy is not None: return a | b
+	return array.array('b', [ x or y for x, y in zip(a, b) ])
+
+def logicalNot(a):
+	if numpy is not None: return ~a
+	return array.array('b', [ not x for x in a ])
+
+def count(mask):
+	if numpy is not None: return int(numpy.count_nonzero(mask))
+	return sum(mask)
+
+def nonzero(mask):
+	if numpy is not None: return numpy.flatnonzero(mask).tolist()
+	return [ i for i, x in enumerate(mask) if x ]
+
+class Columns:
+	def __init__(self, entries, fields, langs):
+		# One row per key, so aliased entries are counted as in entries.values()
+		self.entries = list(entries.values())
+		self.rows = {}
+		for i, entry in enumerate(self.entries):
+			self.rows.setdefault(id(entry), []).append(i)
+		self.fields = { field : intColumn([ getattr(entry, field) for entry in self.entries ]) for field in fields }
+		self.translated = {}
+		for lang in langs: self.updateTranslated(lang)
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __getitem__(self, field):
+		return self.fields[field]
+
+	def updateTranslated(self, lang):
+		"""Rebuild the has-translation flags of lang from the entries."""
+		self.translated[lang] = boolColumn([ entry.trString(lang) != '' for entry in self.entries ])
+
+	def setTranslated(self, entry, lang):
+		"""Update the has-translation flag of lang after the translation of entry changed."""
+		flag = entry.trString(lang) != ''
+		for i in self.rows[id(entry)]: self.translated[lang][i] = flag
+
+	def countTranslated(self, lang):
+		return count(self.translated[lang])
+
+	def assign(self, filters):
+		"""Give each entry to the first filter accepting it. Filters without a mask() method
+		are asked entry by entry."""
+		remaining = full(len(self), True)
+		for filt in filters:
+			if hasattr(filt, 'mask'): mask = logicalAnd(filt.mask(self), remaining)
+			else: mask = boolColumn([ r and filt.isfiltered(entry) for r, entry in zip(remaining, self.entries) ])
+			for i in nonzero(mask):
+				entry = self.entries[i]
+				filt.entries[entry.contextString()] = entry
+			remaining = logicalAnd(remaining, logicalNot(mask))
@@ -1,5 +1,5 @@
 from gettextformat import *
-import os, datetime
+import os, re, bisect, datetime
 
 # PO header
 headerStr = """Project-Id-Version: %s
@@ -13,13 +13,35 @@ Content-Type: text/plain; charset=UTF-8
 Content-Transfer-Encoding: 8bit
 Language: %s"""
 
+dateRe = re.compile('"POT-Creation-Date: .*"\n')
+
+# Write out to path, unless the file only differs from it by its creation date. Returns whether
+# the file has been written.
+def writeIfChanged(path, out):
+	if os.path.exists(path):
+		f = open(path, 'r', encoding='utf-8')
+		old = f.read()
+		f.close()
+		if dateRe.sub('', old, 1) == dateRe.sub('', out, 1): return False
+	f = open(path, 'w', encoding='utf-8')
+	f.write(out)
+	f.close()
+	return True
+
+# Filters can optionally shard their output: with a non-zero shardSize, entries are written to
+# files of at most shardSize entries, each holding a range of shard keys (see the shardKey()
+# method of entries) and named after the filter's basename and the start of its range.
+# Ranges are kept stable: the ranges of the shards already written are reused, a range that
+# grew beyond shardSize is split into ranges of even sizes, and adjacent ranges that fit
+# together in one shard are merged. Editing an entry thus only changes the file of its shard.
 class Filter:
-	def __init__(self, basename, projectShort, project, bugsto):
+	def __init__(self, basename, projectShort, project, bugsto, shardSize = 0):
 		self.basename = basename
 		self.projectShort = projectShort
 		self.project = project
 		self.poDate = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S+0000")
 		self.bugsto = bugsto
+		self.shardSize = shardSize
 		self.entries = {}
 
 	def consider(self, entry):
@@ -31,21 +53,104 @@ class Filter:
 	def sortEntries(self):
 		return sorted(self.entries)
 
-	def output(self, lang):
-		if not os.path.exists(self.projectShort): os.mkdir(self.projectShort)
-		if lang == 'en': fstr = "%s/%s.pot" % (self.projectShort, self.basename,)
-		else: fstr = "%s/%s_%s.po" % (self.projectShort, self.basename, lang)
-		f = open(fstr, 'w', encoding='utf-8')
+	def shardStarts(self):
+		"""Return the sorted range starts of the shard templates written by a previous run."""
+		starts = []
+		prefix = self.basename + '-'
+		if not os.path.exists(self.projectShort): return starts
+		for f in os.listdir(self.projectShort):
+			if f.startswith(prefix) and f.endswith('.pot') and f[len(prefix):-len('.pot')].isdigit():
+				starts.append(int(f[len(prefix):-len('.pot')]))
+		return sorted(starts)
+
+	def splitRange(self, items):
+		"""Split the sorted (shard key, key) items of a range into ranges of even sizes of at
+		most shardSize entries. Entries sharing a shard key stay together."""
+		count = (len(items) + self.shardSize - 1) // self.shardSize
+		target = (len(items) + count - 1) // count
+		ranges = [ [] ]
+		for item in items:
+			cur = ranges[-1]
+			if len(cur) >= target and item[0] != cur[-1][0]:
+				cur = []
+				ranges.append(cur)
+			cur.append(item)
+		return ranges
+
+	def shards(self):
+		"""Map the basename of each file written by the filter to its sorted entry keys."""
+		if not self.shardSize: return { self.basename : self.sortEntries() }
+		items = sorted((self.entries[key].shardKey(), key) for key in self.entries)
+		if len(items) == 0: return {}
+		# Distribute the entries to the existing ranges. Entries before the first one start a
+		# new range.
+		starts = [ start for start in self.shardStarts() if start <= items[-1][0] ]
+		if len(starts) == 0 or items[0][0] < starts[0]: starts.insert(0, items[0][0])
+		ranges = [ [] for start in starts ]
+		for item in items:
+			ranges[bisect.bisect_right(starts, item[0]) - 1].append(item)
+		# Split the ranges that grew too large
+		split = []
+		for start, r in zip(starts, ranges):
+			if len(r) == 0: continue
+			for i, sub in enumerate(self.splitRange(r)):
+				split.append((start if i == 0 else sub[0][0], sub))
+		# Merge the neighbours that fit in one shard
+		merged = []
+		for start, r in split:
+			if len(merged) > 0 and len(merged[-1][1]) + len(r) <= self.shardSize:
+				merged[-1] = (merged[-1][0], merged[-1][1] + r)
+			else:
+				merged.append((start, r))
+		return { "%s-%d" % (self.basename, start) : sorted(item[1] for item in r) for start, r in merged }
+
+	def fileName(self, lang, basename = None):
+		if not basename: basename = self.basename
+		if lang == 'en': return "%s/%s.pot" % (self.projectShort, basename,)
+		else: return "%s/%s_%s.po" % (self.projectShort, basename, lang)
+
+	def fileNames(self, lang):
+		return [ self.fileName(lang, basename) for basename in self.shards() ]
+
+	# Remove the unsharded file and the shards that do not exist anymore, so they are not
+	# loaded again as .po sources. Only the project languages are written, so the unsharded
+	# translations of the other languages are removed along with the template: nothing would
+	# sync or remove them once the filter is sharded.
+	def removeStale(self, lang, shards):
+		if lang == 'en': suffix = '.pot'
+		else: suffix = '_%s.po' % (lang,)
+		for f in os.listdir(self.projectShort):
+			if lang == 'en' and f.startswith(self.basename + '_') and f.endswith('.po'):
+				os.remove(os.path.join(self.projectShort, f))
+				continue
+			if not f.endswith(suffix): continue
+			basename = f[:-len(suffix)]
+			if basename in shards: continue
+			if basename == self.basename or basename.startswith(self.basename + '-') and basename[len(self.basename) + 1:].isdigit():
+				os.remove(os.path.join(self.projectShort, f))
+
+	def outputFile(self, basename, skeys, lang):
+		fstr = self.fileName(lang, basename)
 		entry = GetTextEntry()
 		entry.msgstr = headerStr % (self.project, self.bugsto, self.poDate, lang,)
-		f.write(str(entry))
-		skeys = self.sortEntries()
+		out = [ str(entry) ]
 		cpt = 0
 		for skey in skeys:
 			entry = self.entries[skey].asGettext(lang)
 			if lang == 'en' or entry.trString(lang) != '':
 				cpt += 1
-				f.write(str(entry))
-		f.close()
-		if cpt == 0: os.remove(fstr)
+				out.append(str(entry))
+		if cpt == 0:
+			if os.path.exists(fstr): os.remove(fstr)
+			return cpt
+		writeIfChanged(fstr, ''.join(out))
+		return cpt
+
+	def output(self, lang):
+		if not os.path.exists(self.projectShort): os.mkdir(self.projectShort)
+		shards = self.shards()
+		if self.shardSize: self.removeStale(lang, shards)
+		cpt = 0
+		for basename in shards:
+			cpt += self.outputFile(basename, shards[basename], lang)
 		return cpt
@@ -20,6 +20,8 @@ class GetTextEntry:
 		self.msgstr = ""
 		self.lang = lang
 		self.fuzzy = False
+		# Extracted comments, written as "#." lines
+		self.comments = []
 
 	def contextString(self):
 		return self.msgctxt
@@ -33,6 +35,7 @@ class GetTextEntry:
 
 	def __str__(self):
 		r = ""
+		for comment in self.comments: r += '#. %s\n' % (comment,)
 		if self.fuzzy: r += '#, fuzzy\n'
 		if self.msgctxt:
 			r += 'msgctxt "%s"\n' % (self.msgctxt,)
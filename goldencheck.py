@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# Golden-output equivalence check between two versions of the extraction code.
+#
+# A rewrite of xmlhandler, gettextformat or efilter must produce the same .pot/.po/.jmf/.reg
+# files as the code it replaces, apart from header dates. This script:
+# 1) builds a fixed corpus per module: small JMdict/kanjidic2 sources generated from the first
+#    entries of the checked-in .pot files, along with the checked-in .po and .reg files of the
+#    project languages
+# 2) runs jmdict-extract.py from both code versions (git revisions or the working tree) on
+#    identical copies of that corpus
+# 3) diffs every output file and reports the time and peak memory of each run side by side
+# 4) with -v, validates the output of each side with the povalidate.py of its own code version.
+#    Validation failures are reported apart from byte differences: the exit status is 1 if the
+#    outputs differ, 2 if an output does not validate, 3 if both.
+#
+# The "tx" command called at the end of the extraction is replaced by a no-op. The extraction
+# itself does not validate its output, so that its time is comparable between versions.
+
+import sys, os, re, time, shutil, argparse, tempfile, subprocess
+from gettextformat import *
+
+dateRe = re.compile('^"?POT-Creation-Date: .*$', re.M)
+
+def xmlEscape(s):
+	return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+# Tags adding up to at least pri with the values used by jmdict.JMdictParser
+def priTags(pri):
+	tags = []
+	for tag in ('news1', 'ichi1', 'spec1', 'gail1'):
+		if pri <= 0: break
+		tags.append(tag)
+		pri -= 100
+	return tags
+
+# Priority that makes an entry fall into the filter it was found in
+filterPri = { 'pri380' : 400, 'pri310' : 350, 'pri220' : 300, 'pri200' : 210, 'pri000' : 100 }
+
+def potEntries(d, count):
+	"""Yield (basename, entries) for the .pot files of d, limited to the first count ids of each."""
+	for f in sorted(os.listdir(d)):
+		if not f.endswith('.pot'): continue
+		entries = readPo(open(os.path.join(d, f), 'r', encoding='utf-8'))
+		ids = []
+		ret = []
+		for entry in entries:
+			eid = entry.contextString().split(' ')[0]
+			if not eid in ids:
+				if len(ids) == count: continue
+				ids.append(eid)
+			ret.append(entry)
+		yield f[:-4], ret
+
+def generateJMdict(src, dst, count):
+	entries = {}
+	for basename, ne in potEntries(src, count):
+		pri = filterPri.get(basename.split('-')[0], 0)
+		for entry in ne:
+			eid, sense = [ int(x) for x in entry.contextString().split(' ') ]
+			lines = entry.sourceString().split('\n')
+			e = entries.setdefault(eid, { 'words' : lines[0].split('\t'), 'pri' : pri, 'senses' : {} })
+			e['senses'][sense] = lines[1:]
+	out = [ '<?xml version="1.0" encoding="UTF-8"?>\n<JMdict>\n' ]
+	for eid in sorted(entries):
+		e = entries[eid]
+		out.append('<entry>\n<ent_seq>%d</ent_seq>\n' % (eid,))
+		if len(e['words']) > 1:
+			out.append('<k_ele>\n<keb>%s</keb>\n</k_ele>\n' % (xmlEscape(e['words'][0]),))
+		out.append('<r_ele>\n<reb>%s</reb>\n' % (xmlEscape(e['words'][-1]),))
+		for tag in priTags(e['pri']): out.append('<re_pri>%s</re_pri>\n' % (tag,))
+		out.append('</r_ele>\n')
+		nsenses = max(e['senses']) + 1
+		for sense in range(nsenses):
+			out.append('<sense>\n')
+			for gloss in e['senses'].get(sense, [ 'sense %d' % (sense,) ]):
+				out.append('<gloss xml:lang="eng">%s</gloss>\n' % (xmlEscape(gloss),))
+			out.append('</sense>\n')
+		# Some entries also come with translations in the source
+		if eid % 7 == 0:
+			out.append('<sense>\n<gloss xml:lang="fre">source %d</gloss>\n</sense>\n' % (eid,))
+		out.append('</entry>\n')
+	out.append('</JMdict>\n')
+	f = open(os.path.join(dst, 'JMdict'), 'w', encoding='utf-8')
+	f.write(''.join(out))
+	f.close()
+
+def isReadings(s):
+	return len(s) > 0 and all(0x3040 <= ord(c) <= 0x30ff or c in '.,- ' for c in s)
+
+def generateKanjidic2(src, dst, count):
+	chars = {}
+	for basename, ne in potEntries(src, count):
+		grade, freq = 0, 0
+		if basename.startswith('grade'): grade = int(basename[5:])
+		elif basename.startswith('freq'): freq = int(basename[4:]) // 2
+		for entry in ne:
+			literal, rmgroup = entry.contextString().split(' ')
+			lines = [ line for line in entry.sourceString().split('\n')[1:] if line != '' ]
+			readings = []
+			if len(lines) > 0 and isReadings(lines[0]):
+				readings = lines[0].split(', ')
+				lines = lines[1:]
+			c = chars.setdefault(literal, { 'grade' : grade, 'freq' : freq, 'rmgroups' : {} })
+			c['rmgroups'][int(rmgroup)] = (readings, lines)
+	out = [ '<?xml version="1.0" encoding="UTF-8"?>\n<kanjidic2>\n' ]
+	for literal in sorted(chars):
+		c = chars[literal]
+		out.append('<character>\n<literal>%s</literal>\n<misc>\n' % (literal,))
+		if c['grade']: out.append('<grade>%d</grade>\n' % (c['grade'],))
+		if c['freq']: out.append('<freq>%d</freq>\n' % (c['freq'],))
+		out.append('</misc>\n<reading_meaning>\n')
+		for rmgroup in range(max(c['rmgroups']) + 1):
+			readings, meanings = c['rmgroups'].get(rmgroup, ([], [ 'group %d' % (rmgroup,) ]))
+			out.append('<rmgroup>\n')
+			for r in readings:
+				rtype = 'ja_on'
+				if 0x3040 <= ord(r[0]) < 0x30a0: rtype = 'ja_kun'
+				out.append('<reading r_type="%s">%s</reading>\n' % (rtype, xmlEscape(r)))
+			for m in meanings:
+				out.append('<meaning>%s</meaning>\n' % (xmlEscape(m),))
+			if ord(literal) % 7 == 0:
+				out.append('<meaning m_lang="fr">source %s</meaning>\n' % (literal,))
+			out.append('</rmgroup>\n')
+		out.append('</reading_meaning>\n</character>\n')
+	out.append('</kanjidic2>\n')
+	f = open(os.path.join(dst, 'kanjidic2.xml'), 'w', encoding='utf-8')
+	f.write(''.join(out))
+	f.close()
+
+generators = { 'jmdict' : generateJMdict, 'kanjidic2' : generateKanjidic2 }
+
+def buildCorpus(repo, module, dst, count):
+	client = __import__(module)
+	src = os.path.join(repo, client.projectShort)
+	d = os.path.join(dst, client.projectShort)
+	os.makedirs(os.path.join(d, 'jmf'))
+	generators[client.projectShort](src, d, count)
+	for f in os.listdir(src):
+		keep = f.endswith('.csv')
+		for lang in client.projectLangs:
+			if f.endswith('_%s.po' % (lang,)) or f == '%s_%s.reg' % (client.srcFile, lang): keep = True
+		if keep: shutil.copy(os.path.join(src, f), d)
+
+def exportCode(repo, rev, dst):
+	"""Copy the Python files of revision rev (None for the working tree) of repo to dst."""
+	os.makedirs(dst)
+	if rev is None:
+		files = [ f for f in os.listdir(repo) if f.endswith('.py') ]
+		for f in files: shutil.copy(os.path.join(repo, f), dst)
+		return
+	files = subprocess.check_output([ 'git', 'ls-tree', '--name-only', rev ], cwd = repo, universal_newlines = True).split('\n')
+	for f in files:
+		if not f.endswith('.py'): continue
+		content = subprocess.check_output([ 'git', 'show', '%s:%s' % (rev, f) ], cwd = repo)
+		open(os.path.join(dst, f), 'wb').write(content)
+
+helpOptionRe = re.compile('^  (-.*?)(  |$)')
+
+def extractOptions(extract, env):
+	"""Return the options listed by the --help of extract."""
+	out = subprocess.check_output([ sys.executable, extract, '--help' ], env = env, universal_newlines = True)
+	options = set()
+	for line in out.split('\n'):
+		m = helpOptionRe.match(line)
+		if m: options.update([ o.split(' ')[0] for o in m.group(1).split(', ') ])
+	return options
+
+def runExtract(code, module, workdir, bindir):
+	extract = os.path.join(code, 'jmdict-extract.py')
+	args = [ sys.executable, extract, module ]
+	env = dict(os.environ)
+	env['PYTHONPATH'] = code
+	env['PATH'] = bindir + os.pathsep + env['PATH']
+	# Do not count validation against versions that do not have it
+	if '--no-check' in extractOptions(extract, env): args.append('--no-check')
+	start = time.perf_counter()
+	proc = subprocess.Popen(args, cwd = workdir, env = env, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+	output = proc.stdout.read()
+	pid, status, rusage = os.wait4(proc.pid, 0)
+	elapsed = time.perf_counter() - start
+	proc.stdout.close()
+	proc.returncode = os.waitstatus_to_exitcode(status)
+	if proc.returncode != 0:
+		print(output.decode('utf-8', 'replace'))
+		raise RuntimeError('%s failed with status %d' % (extract, proc.returncode))
+	return elapsed, rusage.ru_maxrss
+
+summaryRe = re.compile('^[0-9]+ files checked, [0-9]+ errors$')
+
+def runValidate(code, module, workdir):
+	"""Validate the files written in workdir with the validator of code. Returns the error
+	messages, or None if that version has no validator."""
+	validator = os.path.join(code, 'povalidate.py')
+	if not os.path.exists(validator): return None
+	env = dict(os.environ)
+	env['PYTHONPATH'] = code
+	proc = subprocess.run([ sys.executable, validator, module ], cwd = workdir, env = env, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+	lines = [ l for l in proc.stdout.split('\n') if l != '' ]
+	if proc.returncode not in (0, 1) or len(lines) == 0 or not summaryRe.match(lines[-1]):
+		print(proc.stdout)
+		raise RuntimeError('%s failed with status %d' % (validator, proc.returncode))
+	return lines[:-1]
+
+def outputFiles(d):
+	ret = {}
+	for root, dirs, files in os.walk(d):
+		dirs[:] = [ x for x in dirs if not x.startswith('.') ]
+		for f in files:
+			if f.endswith('.csv') or f in ('JMdict', 'kanjidic2.xml'): continue
+			path = os.path.join(root, f)
+			ret[os.path.relpath(path, d)] = path
+	return ret
+
+def compareOutputs(a, b):
+	"""Return the list of differences between the output files of directories a and b."""
+	diffs = []
+	fa = outputFiles(a)
+	fb = outputFiles(b)
+	for f in sorted(set(fa) | set(fb)):
+		if not f in fa or not f in fb:
+			diffs.append('%s: only written by %s' % (f, 'legacy' if f in fa else 'new'))
+			continue
+		ca = dateRe.sub('', open(fa[f], 'rb').read().decode('utf-8', 'surrogateescape'))
+		cb = dateRe.sub('', open(fb[f], 'rb').read().decode('utf-8', 'surrogateescape'))
+		if ca != cb:
+			la = ca.split('\n')
+			lb = cb.split('\n')
+			line = 0
+			while line < min(len(la), len(lb)) and la[line] == lb[line]: line += 1
+			diffs.append('%s: differs from line %d' % (f, line + 1))
+	return diffs
+
+if __name__ == "__main__":
+	aparser = argparse.ArgumentParser(description = "Check that two versions of the extraction code produce the same output.")
+	aparser.add_argument('module',
+		nargs = '*',
+		default = [ 'jmdict', 'kanjidic2' ],
+		help = 'Modules to check (default: jmdict kanjidic2)')
+	aparser.add_argument('-l',
+		action = 'store',
+		default = 'HEAD',
+		help = 'git revision of the legacy code (default: HEAD)')
+	aparser.add_argument('-n',
+		action = 'store',
+		default = None,
+		help = 'git revision of the new code (default: working tree)')
+	aparser.add_argument('-c',
+		action = 'store',
+		type = int,
+		default = 200,
+		help = 'Number of ids taken from each .pot file to generate the sources (default: 200)')
+	aparser.add_argument('-k',
+		action = 'store_true',
+		help = 'Keep the temporary directory')
+	aparser.add_argument('-v',
+		action = 'store_true',
+		help = 'Also validate the output of each side')
+	cmdargs = aparser.parse_args()
+
+	repo = os.path.dirname(os.path.abspath(__file__))
+	tmp = tempfile.mkdtemp(prefix = 'goldencheck-')
+	bindir = os.path.join(tmp, 'bin')
+	os.makedirs(bindir)
+	tx = os.path.join(bindir, 'tx')
+	open(tx, 'w').write('#!/bin/sh\nexit 0\n')
+	os.chmod(tx, 0o755)
+	exportCode(repo, cmdargs.l, os.path.join(tmp, 'legacy'))
+	exportCode(repo, cmdargs.n, os.path.join(tmp, 'new'))
+
+	different = False
+	invalid = False
+	print('%-12s%-10s%12s%12s%14s%14s%s' % ('Module', 'Result', 'legacy (s)', 'new (s)', 'legacy (KiB)', 'new (KiB)', '  Validation' if cmdargs.v else ''))
+	for module in cmdargs.module:
+		corpus = os.path.join(tmp, 'corpus-%s' % (module,))
+		buildCorpus(repo, module, corpus, cmdargs.c)
+		results = {}
+		validation = {}
+		for side in ('legacy', 'new'):
+			workdir = os.path.join(tmp, '%s-%s' % (side, module))
+			shutil.copytree(corpus, workdir)
+			results[side] = runExtract(os.path.join(tmp, side), module, workdir, bindir)
+			if cmdargs.v: validation[side] = runValidate(os.path.join(tmp, side), module, workdir)
+		projectShort = __import__(module).projectShort
+		diffs = compareOutputs(os.path.join(tmp, 'legacy-%s' % (module,), projectShort), os.path.join(tmp, 'new-%s' % (module,), projectShort))
+		status = ''
+		if cmdargs.v:
+			status = '  ' + ', '.join([ '%s %s' % (side, 'n/a' if errors is None else 'valid' if len(errors) == 0 else 'INVALID')
+				for side, errors in sorted(validation.items()) ])
+		print('%-12s%-10s%12.2f%12.2f%14d%14d%s' % (module, 'same' if len(diffs) == 0 else 'DIFFERENT', results['legacy'][0], results['new'][0], results['legacy'][1], results['new'][1], status))
+		for diff in diffs: print('  ' + diff)
+		if len(diffs) > 0: different = True
+		for side, errors in sorted(validation.items()):
+			for error in errors or []: print('  %s: %s' % (side, error))
+			if errors: invalid = True
+
+	if cmdargs.k: print('Files kept in %s' % (tmp,))
+	else: shutil.rmtree(tmp)
+	if different or invalid: sys.exit(int(different) + 2 * int(invalid))
@@ -40,48 +40,59 @@
 # 5) Write new .po, .pot, .reg files
 # 6) Replace old JMdict with new one
 
-import sys, datetime, argparse, os.path
+#
+# With --watch, the script then stays resident and keeps the parsed source entries, .po entries
+# and regressions in memory. The module directory is polled for modified .po files, which are
+# the only ones re-read, and steps 3) to 5) are re-run for their languages only. Only the files
+# whose content may have changed are rewritten, and the suggestions of these languages are
+# computed again. A modified source file triggers a full reload.
+# Validation errors are reported without stopping the watch, and the Transifex configuration is
+# updated whenever shards are created or removed.
+
+#
+# Translation suggestions:
+# The English glosses of many entries are identical or close to those of other, translated
+# entries. After merging, the translated entries are loaded into a translation memory (see
+# transmem.py), which is searched for the untranslated entries and the regressions. These
+# entries are written per language to a "<source>_<lang>.sug" file, with their ranked
+# suggestions as "#." comments. Suggestions quote the translations of other entries, so they
+# are kept out of the .po files: a new translation would otherwise rewrite the files of
+# unrelated shards. The .sug files are committed by update_all but never pushed to Transifex,
+# and are only rewritten when their suggestions change.
+
+import sys, datetime, argparse, os.path, time, configparser
 from gettextformat import *
-import efilter
+import efilter, povalidate, columns, transmem
 import subprocess
 
-if __name__ == "__main__":
-	aparser = argparse.ArgumentParser(description = "Build a .pot file and merge .po files from a source.")
-	aparser.add_argument('module',
-		nargs = 1,
-		help = 'Module to use for extraction/merging')
-	aparser.add_argument('-t',
-		action = 'store',
-		nargs = '*',
-		default = [],
-		help = 'Additional .po files to load')
-	cmdargs = aparser.parse_args()
+def printStage(title):
+	print('%-30s' % (title,), end='')
+	sys.stdout.flush()
 
-	client = __import__(cmdargs.module[0])
+def printCounts(counts, langs):
+	for lang in langs:
+		print('%-10s' % ('%s: %d' % (lang, counts[lang])), end='')
+		sys.stdout.flush()
+	print('')
 
-	# Parse source file
-	print('%-30s' % ('Loading %s...' % (client.srcFile,)), end='')
-	sys.stdout.flush()
+def regFileName(client, lang):
+	return os.path.join(client.projectShort, client.srcFile) + '_%s.reg' % (lang,)
+
+# Parse source file
+def loadSource(client):
+	printStage('Loading %s...' % (client.srcFile,))
 	srcEntries = client.parseSrcEntries(os.path.join(client.projectShort, client.srcFile))
-	srcCpt = { lang : 0 for lang in client.projectLangs }
-	for entry in srcEntries.values():
-		for lang in client.projectLangs:
-			if lang in entry.translations: srcCpt[lang] += 1
-	for lang in client.projectLangs:
-		print('%-10s' % ('%s: %d' % (lang, srcCpt[lang])), end='')
-	print('')
+	cols = columns.Columns(srcEntries, client.columnFields, client.projectLangs)
+	printCounts({ lang : cols.countTranslated(lang) for lang in client.projectLangs }, client.projectLangs)
+	return srcEntries, cols
 
-	# Parse .po files
-	print('%-30s' % ('Loading .po files...'), end='')
-	sys.stdout.flush()
-	if os.path.exists(client.projectShort): poSources = [ os.path.join(client.projectShort, p) for p in filter(lambda f: f.endswith(".po"), os.listdir(client.projectShort)) ]
-	else: poSources = []
-	poSources += cmdargs.t
-	poEntries = {}
-	poCpt = {}
-	for lang in client.projectLangs:
-		poEntries[lang] = {}
-		poCpt[lang] = 0
+def listPoSources(client):
+	if os.path.exists(client.projectShort): return [ os.path.join(client.projectShort, p) for p in filter(lambda f: f.endswith(".po"), os.listdir(client.projectShort)) ]
+	else: return []
+
+# Parse .po files into poEntries, recording which contexts come from which file in poFiles
+def loadPo(client, poSources, poEntries, poFiles):
+	poCpt = { lang : 0 for lang in client.projectLangs }
 	for pof in poSources:
 		ne = readPo(open(pof, 'r', encoding='utf-8'))
 		if len(ne) > 0:
@@ -96,17 +107,16 @@ if __name__ == "__main__":
 				lEntries[ctx] = entry
 				if entry.trString(lang) != '': poCpt[lang] += 1
 			poEntries[lang] = lEntries
-	for lang in client.projectLangs:
-		print('%-10s' % ('%s: %d' % (lang, poCpt[lang])), end='')
-	print('')
+			poFiles[pof] = [ entry.contextString() for entry in ne ]
+	return poCpt
 
-	# Parse regressions
-	print('%-30s' % ('Loading regressions...'), end='')
-	sys.stdout.flush()
+# Parse regressions
+def loadRegressions(client, langs):
+	printStage('Loading regressions...')
 	regressions = {}
-	for lang in client.projectLangs:
+	for lang in langs:
 		regressions[lang] = {}
-		regfile = os.path.join(client.projectShort, client.srcFile) + '_%s.reg' % (lang,)
+		regfile = regFileName(client, lang)
 		if os.path.exists(regfile):
 			ne = readPo(open(regfile, 'r', encoding='utf-8'))
 			if len(ne) > 0:
@@ -116,16 +126,16 @@ if __name__ == "__main__":
 		print('%-10s' % ('%s: %d' % (lang, len(regressions[lang]))), end='')
 		sys.stdout.flush()
 	print('')
+	return regressions
 
-	# Check for fixed regressions
-	# A regression is fixed if:
-	# - the entry has been deleted
-	# - a translation (not "fuzzy") is provided by its .po file
-	print('%-30s' % ('Checking fixed regressions...'), end='')
-	sys.stdout.flush()
-	fixedRegsCpt = { lang : 0 for lang in client.projectLangs }
-	for lang in client.projectLangs:
-		cpt = 0
+# Check for fixed regressions
+# A regression is fixed if:
+# - the entry has been deleted
+# - a translation (not "fuzzy") is provided by its .po file
+def fixRegressions(regressions, poEntries, langs):
+	printStage('Checking fixed regressions...')
+	fixedRegsCpt = { lang : 0 for lang in langs }
+	for lang in langs:
 		fixed = []
 		for ctxstr in regressions[lang]:
 			if ctxstr not in poEntries[lang]: continue
@@ -140,17 +150,17 @@ if __name__ == "__main__":
 		sys.stdout.flush()
 	print('')
 
-	# Check for new regressions
-	# We have a new regression for a given language if:
-	# - an entry exists in the .po file and has a translation
-	# - the source string from the source file is different from the one
-	#   in the .po
-	print('%-30s' % ('Checking new regressions...'), end='')
-	sys.stdout.flush()
-	newRegsCpt = { lang : 0 for lang in client.projectLangs }
+# Check for new regressions
+# We have a new regression for a given language if:
+# - an entry exists in the .po file and has a translation
+# - the source string from the source file is different from the one
+#   in the .po
+def findRegressions(srcEntries, regressions, poEntries, langs):
+	printStage('Checking new regressions...')
+	newRegsCpt = { lang : 0 for lang in langs }
 	for entry in srcEntries.values():
 		ctx = entry.contextString()
-		for lang in poEntries:
+		for lang in langs:
 			lEntries = poEntries[lang]
 			if ctx in lEntries:
 				poEntry = lEntries[ctx]
@@ -162,19 +172,17 @@ if __name__ == "__main__":
 					reg.msgid = entry.sourceString()
 					reg.msgstr = poEntry.trString(lang)
 					regressions[lang][ctx] = reg
-	for lang in client.projectLangs:
-		print('%-10s' % ('%s: %d' % (lang, newRegsCpt[lang],)), end='')
-	print('')
+	printCounts(newRegsCpt, langs)
 
-	# Merge the new .po translations into the source file entries
-	print('%-30s' % 'Merging new .po data...', end='')
-	sys.stdout.flush()
-	updatedPoCpt = { lang : 0 for lang in client.projectLangs }
-	newPoCpt = { lang : 0 for lang in client.projectLangs }
-	newSourceCpt = { lang : 0 for lang in client.projectLangs }
+# Merge the new .po translations into the source file entries
+def mergePo(srcEntries, cols, poEntries, langs):
+	printStage('Merging new .po data...')
+	updatedPoCpt = { lang : 0 for lang in langs }
+	newPoCpt = { lang : 0 for lang in langs }
+	newSourceCpt = { lang : 0 for lang in langs }
 	for key in srcEntries:
 		srcEntry = srcEntries[key]
-		for lang in client.projectLangs:
+		for lang in langs:
 			sString = srcEntry.trString(lang)
 			if key in poEntries[lang]:
 				poEntry = poEntries[lang][key]
@@ -189,56 +197,42 @@ if __name__ == "__main__":
 				if not sString: newPoCpt[lang] += 1
 				else: updatedPoCpt[lang] += 1
 				srcEntry.translations[lang] = tString
+				cols.setTranslated(srcEntry, lang)
 			else:
 				if sString: newSourceCpt[lang] += 1
-	for lang in client.projectLangs:
-		print('%-10s' % ('%s: %d' % (lang, newPoCpt[lang] + updatedPoCpt[lang])), end='')
-		sys.stdout.flush()
-	print('')
-	print('%-30s' % '  New translations:', end='')
-	for lang in client.projectLangs:
-		print('%-10s' % ('%s: %d' % (lang, newPoCpt[lang])), end='')
-	print('')
-	print('%-30s' % '  Updated translations:', end='')
-	for lang in client.projectLangs:
-		print('%-10s' % ('%s: %d' % (lang, updatedPoCpt[lang])), end='')
-	print('')
-	print('%-30s' % '  New source strings:', end='')
-	for lang in client.projectLangs:
-		print('%-10s' % ('%s: %d' % (lang, newSourceCpt[lang])), end='')
-	print('')
+	printCounts({ lang : newPoCpt[lang] + updatedPoCpt[lang] for lang in langs }, langs)
+	printStage('  New translations:')
+	printCounts(newPoCpt, langs)
+	printStage('  Updated translations:')
+	printCounts(updatedPoCpt, langs)
+	printStage('  New source strings:')
+	printCounts(newSourceCpt, langs)
 
-	# Merge regressions into the parsed source entries and add fuzzy tags
-	print('%-30s' % ('Merging regressions...'), end='')
-	sys.stdout.flush()
-	mergedRegsCpt = { lang : 0 for lang in client.projectLangs }
-	for lang in client.projectLangs:
+# Merge regressions into the parsed source entries and add fuzzy tags
+def mergeRegressions(srcEntries, cols, regressions, langs):
+	printStage('Merging regressions...')
+	mergedRegsCpt = { lang : 0 for lang in langs }
+	for lang in langs:
 		for key in regressions[lang]:
 			if key in srcEntries:
 				poEntry = regressions[lang][key]
 				srcEntry = srcEntries[key]
 				srcEntry.translations[lang] = poEntry.trString(lang)
+				cols.setTranslated(srcEntry, lang)
 				srcEntry.fuzzies.append(lang)
 				mergedRegsCpt[lang] += 1
 		print('%-10s' % ('%s: %d' % (lang, mergedRegsCpt[lang])), end='')
 		sys.stdout.flush()
 	print('')
 
-	# Report number of translations per language
-	print('%-30s' % ('Total translations:'), end='')
-	sys.stdout.flush()
-	for lang in client.projectLangs:
-		cpt = 0
-		for entry in srcEntries.values():
-			if entry.trString(lang) != '': cpt += 1
-		print('%-10s' % ('%s: %d' % (lang, cpt)), end='')
-		sys.stdout.flush()
-	print('')
+# Report number of translations per language
+def countTranslations(cols, langs):
+	printStage('Total translations:')
+	printCounts({ lang : cols.countTranslated(lang) for lang in langs }, langs)
 
-	# Filter entries
-	print('Filtering entries...')
-	filters = client.filtersList()
-	for entry in srcEntries.values():
+# Assign entries to the first filter that accepts them, one at a time (see columns.Columns.assign())
+def filterEntries(filters, entries):
+	for entry in entries:
 		filtered = False
 		for filt in filters:
 			if filt.consider(entry):
@@ -246,31 +240,30 @@ if __name__ == "__main__":
 				break
 		if not filtered:
 			pass
-		
-	# Output .pot files
-	print('%-30s' % ('Writing new .pot files...'), end='')
-	sys.stdout.flush()
+
+# Output .pot files
+def writePot(filters):
+	printStage('Writing new .pot files...')
 	cpt = 0
 	for filt in filters:
 		cpt += filt.output('en')
 	print("%d entries written" % (cpt,))
 
-	# Output .po files
-	if not len(client.projectLangs) == 0:
-		print('%-30s' % ('Writing new .po files...'), end='')
+# Output .po files
+def writePo(filters, langs):
+	printStage('Writing new .po files...')
+	for lang in langs:
+		cpt = 0
+		for filt in filters:
+			cpt += filt.output(lang)
+		print('%-10s' % ('%s: %d' % (lang, cpt)), end='')
 		sys.stdout.flush()
-		for lang in client.projectLangs:
-			cpt = 0
-			for filt in filters:
-				cpt += filt.output(lang)
-			print('%-10s' % ('%s: %d' % (lang, cpt)), end='')
-			sys.stdout.flush()
-		print('')
-
-	# Output .jmf files
-	print('%-30s' % ('Writing new .jmf files...'), end='')
-	sys.stdout.flush()
-	for lang in client.projectLangs:
+	print('')
+
+# Output .jmf files
+def writeJMF(client, filters, langs):
+	printStage('Writing new .jmf files...')
+	for lang in langs:
 		outf = open(os.path.join(client.projectShort, "jmf", "%s.jmf" % (lang)), 'w', encoding='utf-8')
 		tEntries = {}
 		for filt in filters:
@@ -285,31 +278,334 @@ if __name__ == "__main__":
 		sys.stdout.flush()
 	print('')
 
-	# Write new regressions list
-	print('%-30s' % ('Writing regressions...'), end='')
-	sys.stdout.flush()
-	for lang in client.projectLangs:
-		regfile = os.path.join(client.projectShort, client.srcFile) + '_%s.reg' % (lang,)
-		outf = open(regfile, 'w', encoding='utf-8')
+# Write new regressions list
+def writeRegressions(client, regressions, langs):
+	printStage('Writing regressions...')
+	for lang in langs:
+		outf = open(regFileName(client, lang), 'w', encoding='utf-8')
 		header = GetTextEntry()
 		header.msgstr = efilter.headerStr % (client.projectDesc, client.ownerInfo, datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S+0000"), lang)
 		outf.write(str(header))
 		for entry in sorted(regressions[lang].keys()):
 			outf.write(str(regressions[lang][entry]))
+		outf.close()
 		print('%-10s' % ('%s: %d' % (lang, len(regressions[lang]))), end='')
 		sys.stdout.flush()
 	print('')
 
-	# Update transifex resources
+# Build a translation memory of the English glosses of the translated entries
+def buildTranslationMemory(srcEntries, langs):
+	printStage('Building translation memory...')
+	tm = transmem.TranslationMemory()
+	seen = set()
+	for entry in srcEntries.values():
+		# Skip the aliases of an entry
+		if id(entry) in seen: continue
+		seen.add(id(entry))
+		for lang in langs:
+			if entry.trString(lang) != '' and not lang in entry.fuzzies:
+				tm.add(entry.trString('en'), lang, entry.trString(lang))
+	print('%d sources' % (len(tm),))
+	return tm
+
+def sugFileName(client, lang):
+	return os.path.join(client.projectShort, client.srcFile) + '_%s.sug' % (lang,)
+
+# Write the suggestions of the translation memory for the untranslated entries and regressions.
+# Returns the paths of the files written.
+def writeSuggestions(client, srcEntries, tm, langs):
+	printStage('Writing suggestions...')
+	entries = {}
+	for entry in srcEntries.values(): entries[entry.contextString()] = entry
+	paths = []
+	for lang in langs:
+		header = GetTextEntry()
+		header.msgstr = efilter.headerStr % (client.projectDesc, client.ownerInfo, datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S+0000"), lang)
+		out = [ str(header) ]
+		for key in sorted(entries):
+			entry = entries[key]
+			if entry.trString(lang) != '' and not lang in entry.fuzzies: continue
+			suggestions = tm.suggest(entry.trString('en'), lang)
+			if len(suggestions) == 0: continue
+			sug = entry.asGettext(lang)
+			for score, tr, source in suggestions:
+				sug.comments.append('%.2f: %s (%s)' % (score, tr.replace('\n', ' / '), source.replace('\n', ' / ')))
+			out.append(str(sug))
+		path = sugFileName(client, lang)
+		if efilter.writeIfChanged(path, ''.join(out)): paths.append(path)
+		print('%-10s' % ('%s: %d' % (lang, len(out) - 1)), end='')
+		sys.stdout.flush()
+	print('')
+	return paths
+
+# Write the indexes the module derives from its source entries, if any
+def writeIndexes(client, srcEntries):
+	if not hasattr(client, 'writeIndexes'): return
+	printStage('Writing indexes...')
+	print('%d keys written' % (client.writeIndexes(srcEntries),))
+
+# Validate the written files before they are pushed anywhere. If paths is given, only these
+# files are checked.
+def validateOutput(client, paths = None):
+	printStage('Validating output files...')
+	tasks = povalidate.moduleTasks(client)
+	if paths is not None: tasks = [ t for t in tasks if t[0] in paths ]
+	errors, cpt = povalidate.validate(tasks)
+	print('%d files checked, %d errors' % (cpt, len(errors)))
+	for error in errors: print(error)
+	return len(errors) == 0
+
+# Basenames of the files written by filters, one per shard for sharded filters
+def shardNames(filters):
+	basenames = []
+	for filt in filters: basenames += sorted(filt.shards())
+	return basenames
+
+# Update transifex resources. Sharded filters get one resource per shard.
+def updateTransifex(client, filters):
 	print('Updating Transifex resources...')
+	basenames = shardNames(filters)
+	updateRootTxConfig(client, basenames)
 	curDir = os.getcwd()
 	os.chdir(os.path.join(curDir, client.projectShort))
 	if not os.path.exists('.tx'): os.mkdir('.tx')
 	open('.tx/config', 'w').write('[main]\nhost = https://www.transifex.net\ntype = PO\n')
-	for filt in filters:
+	for basename in basenames:
 		comm = ["tx", "set", "--execute", "--auto-local", "--source-lang", "en"]
-		comm += ["-r", "%s.%s" % (client.txProject, filt.basename)]
-		comm += ["%s_<lang>.po" % (filt.basename)]
-		comm += ["--source-file", "%s.pot" % (filt.basename)]
+		comm += ["-r", "%s.%s" % (client.txProject, basename)]
+		comm += ["%s_<lang>.po" % (basename)]
+		comm += ["--source-file", "%s.pot" % (basename)]
 		subprocess.check_output(comm)
 	os.chdir(curDir)
+
+# The top-level .tx/config, used by update_all, lists the resources of all modules. Replace
+# those of client with basenames, keeping the other sections where they are.
+def updateRootTxConfig(client, basenames):
+	if not os.path.exists('.tx/config'): return
+	old = configparser.ConfigParser()
+	old.optionxform = str
+	old.read('.tx/config')
+	new = configparser.ConfigParser()
+	new.optionxform = str
+	added = False
+	for section in old.sections():
+		if not section.startswith(client.txProject + '.'):
+			new[section] = old[section]
+			continue
+		if added: continue
+		added = True
+		for basename in basenames:
+			new['%s.%s' % (client.txProject, basename)] = {
+				'file_filter' : '%s/%s_<lang>.po' % (client.projectShort, basename),
+				'source_file' : '%s/%s.pot' % (client.projectShort, basename),
+				'source_lang' : 'en',
+				'type' : 'PO' }
+	if not added: return
+	f = open('.tx/config', 'w')
+	new.write(f)
+	f.close()
+
+# Rebuild the .po entries of lang from what has just been written, i.e. what a new run would load
+def outputPoEntries(filters, lang, poEntries, poFiles):
+	poEntries[lang] = {}
+	for filt in filters:
+		shards = filt.shards()
+		for basename in shards:
+			keys = []
+			for key in shards[basename]:
+				entry = filt.entries[key]
+				if entry.trString(lang) != '':
+					poEntries[lang][key] = entry.asGettext(lang)
+					keys.append(key)
+			if len(keys) > 0: poFiles[filt.fileName(lang, basename)] = keys
+
+# Modification times of the source file and .po files of the module
+def scanMtimes(client):
+	mtimes = {}
+	for f in os.listdir(client.projectShort):
+		if f.endswith('.po') or f == client.srcFile:
+			path = os.path.join(client.projectShort, f)
+			mtimes[path] = os.stat(path).st_mtime_ns
+	return mtimes
+
+def watch(client, extraPo, srcEntries, cols, srcTranslations, poEntries, poFiles, regressions, filters, interval, check):
+	srcPath = os.path.join(client.projectShort, client.srcFile)
+	mtimes = scanMtimes(client)
+	print('Watching %s for changes...' % (client.projectShort,))
+	while True:
+		time.sleep(interval)
+		newMtimes = scanMtimes(client)
+		changed = [ path for path in set(mtimes) | set(newMtimes) if mtimes.get(path) != newMtimes.get(path) ]
+		if len(changed) == 0: continue
+		start = time.time()
+		if srcPath in changed:
+			print('%s changed, reloading everything' % (client.srcFile,))
+			basenames = shardNames(filters)
+			srcEntries, cols, srcTranslations, poEntries, poFiles, regressions, filters = extract(client, extraPo, True)
+			# Invalid files are reported but do not stop watching, they will be fixed by a later pass
+			if check: validateOutput(client)
+			if shardNames(filters) != basenames: updateTransifex(client, filters)
+			mtimes = scanMtimes(client)
+			print('Done in %.3fs' % (time.time() - start,))
+			continue
+
+		# Only reload the changed .po files of the project languages
+		langs = []
+		for path in sorted(changed):
+			lang = None
+			for l in client.projectLangs:
+				if path.endswith('_%s.po' % (l,)): lang = l
+			if lang is None: continue
+			if not lang in langs: langs.append(lang)
+			for ctx in poFiles.pop(path, []):
+				poEntries[lang].pop(ctx, None)
+			if path in newMtimes:
+				printStage('Reloading %s...' % (os.path.basename(path),))
+				before = len(poEntries[lang])
+				loadPo(client, [ path ], poEntries, poFiles)
+				print('%d entries' % (len(poEntries[lang]) - before,))
+		mtimes = newMtimes
+		if len(langs) == 0: continue
+
+		# Restore the source translations of these languages and merge them again
+		previous = {}
+		for key in srcEntries:
+			entry = srcEntries[key]
+			for lang in langs:
+				previous[(key, lang)] = (entry.trString(lang), lang in entry.fuzzies)
+				if lang in srcTranslations[key]: entry.translations[lang] = srcTranslations[key][lang]
+				elif lang in entry.translations: del entry.translations[lang]
+				if lang in entry.fuzzies: entry.fuzzies.remove(lang)
+		for lang in langs: cols.updateTranslated(lang)
+		fixRegressions(regressions, poEntries, langs)
+		findRegressions(srcEntries, regressions, poEntries, langs)
+		mergePo(srcEntries, cols, poEntries, langs)
+		mergeRegressions(srcEntries, cols, regressions, langs)
+		countTranslations(cols, langs)
+
+		basenames = shardNames(filters)
+		# Move the modified entries to their new filter if needed. Filters whose membership
+		# changed are rewritten for every language, others only for the modified ones.
+		modified = {}
+		for (key, lang), (tr, fuzzy) in previous.items():
+			entry = srcEntries[key]
+			if entry.trString(lang) != tr or (lang in entry.fuzzies) != fuzzy:
+				modified.setdefault(key, []).append(lang)
+		# Files that changed on disk are rewritten so they end up as a complete run would leave them
+		dirty = set()
+		for filt in filters:
+			for lang in langs:
+				for path in filt.fileNames(lang):
+					if path in changed: dirty.add((filt, lang))
+		for key in modified:
+			entry = srcEntries[key]
+			old = [ filt for filt in filters if key in filt.entries ]
+			for filt in old: del filt.entries[key]
+			filterEntries(filters, [ entry ])
+			new = [ filt for filt in filters if key in filt.entries ]
+			if old != new:
+				for filt in old + new: dirty.add((filt, None))
+			else:
+				for filt in new:
+					for lang in modified[key]: dirty.add((filt, lang))
+		now = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S+0000")
+		written = []
+		for filt in filters:
+			outLangs = [ lang for lang in langs if (filt, lang) in dirty ]
+			if (filt, None) in dirty: outLangs = [ 'en' ] + list(client.projectLangs)
+			filt.poDate = now
+			for lang in outLangs:
+				filt.output(lang)
+				written += filt.fileNames(lang) + [ filt.fileName(lang) ]
+		print('%-30s%d files' % ('Rewritten .pot/.po files:', len(written)))
+		writeJMF(client, filters, langs)
+		writeRegressions(client, regressions, langs)
+		written += [ regFileName(client, lang) for lang in langs ]
+		# Suggestions of a language only depend on its translations, so rebuilding the memory
+		# for the merged languages gives the suggestions of a complete run
+		tm = buildTranslationMemory(srcEntries, langs)
+		written += writeSuggestions(client, srcEntries, tm, langs)
+		if check: validateOutput(client, written)
+		if shardNames(filters) != basenames: updateTransifex(client, filters)
+
+		# What has been written is what the next pass must start from
+		for lang in langs:
+			for path in list(poFiles):
+				if path.endswith('_%s.po' % (lang,)): del poFiles[path]
+			outputPoEntries(filters, lang, poEntries, poFiles)
+		for path in written:
+			if path in mtimes: del mtimes[path]
+			if os.path.exists(path): mtimes[path] = os.stat(path).st_mtime_ns
+		print('Done in %.3fs' % (time.time() - start,))
+
+# Run a complete extraction/merge for client. Returns the state watch() needs to continue.
+def extract(client, extraPo, keepSource = False):
+	srcEntries, cols = loadSource(client)
+	srcTranslations = None
+	if keepSource: srcTranslations = { key : dict(entry.translations) for key, entry in srcEntries.items() }
+
+	printStage('Loading .po files...')
+	poEntries = { lang : {} for lang in client.projectLangs }
+	poFiles = {}
+	poCpt = loadPo(client, listPoSources(client) + extraPo, poEntries, poFiles)
+	printCounts(poCpt, client.projectLangs)
+
+	regressions = loadRegressions(client, client.projectLangs)
+	fixRegressions(regressions, poEntries, client.projectLangs)
+	findRegressions(srcEntries, regressions, poEntries, client.projectLangs)
+	mergePo(srcEntries, cols, poEntries, client.projectLangs)
+	mergeRegressions(srcEntries, cols, regressions, client.projectLangs)
+	countTranslations(cols, client.projectLangs)
+
+	# Filter entries
+	print('Filtering entries...')
+	filters = client.filtersList()
+	cols.assign(filters)
+
+	writePot(filters)
+	if not len(client.projectLangs) == 0:
+		writePo(filters, client.projectLangs)
+	writeJMF(client, filters, client.projectLangs)
+	writeRegressions(client, regressions, client.projectLangs)
+	tm = buildTranslationMemory(srcEntries, client.projectLangs)
+	writeSuggestions(client, srcEntries, tm, client.projectLangs)
+	writeIndexes(client, srcEntries)
+
+	if keepSource:
+		poFiles = {}
+		for lang in client.projectLangs:
+			outputPoEntries(filters, lang, poEntries, poFiles)
+	return srcEntries, cols, srcTranslations, poEntries, poFiles, regressions, filters
+
+if __name__ == "__main__":
+	aparser = argparse.ArgumentParser(description = "Build a .pot file and merge .po files from a source.")
+	aparser.add_argument('module',
+		nargs = 1,
+		help = 'Module to use for extraction/merging')
+	aparser.add_argument('-t',
+		action = 'store',
+		nargs = '*',
+		default = [],
+		help = 'Additional .po files to load')
+	aparser.add_argument('--no-check',
+		action = 'store_true',
+		help = 'Do not validate the written files')
+	aparser.add_argument('-w', '--watch',
+		action = 'store_true',
+		help = 'Stay resident and merge modified .po files')
+	aparser.add_argument('--interval',
+		action = 'store',
+		type = float,
+		default = 1.0,
+		help = 'Polling interval of --watch, in seconds (default: 1)')
+	cmdargs = aparser.parse_args()
+
+	client = __import__(cmdargs.module[0])
+
+	state = extract(client, cmdargs.t, cmdargs.watch)
+	srcEntries, cols, srcTranslations, poEntries, poFiles, regressions, filters = state
+	if not cmdargs.no_check and not validateOutput(client): sys.exit(1)
+	updateTransifex(client, filters)
+
+	if cmdargs.watch:
+		watch(client, cmdargs.t, srcEntries, cols, srcTranslations, poEntries, poFiles, regressions, filters, cmdargs.interval, not cmdargs.no_check)
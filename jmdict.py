@@ -6,7 +6,7 @@ ownerInfo = 'Alexandre Courbot <gnurou@gmail.com>'
 txProject = 'jmdict-i18n'
 srcFile = 'JMdict'
 
-import xmlhandler, xml.sax, efilter, os.path
+import xmlhandler, xml.sax, efilter, columns, kanjiindex, os.path
 from gettextformat import *
 
 # Associate 3 letters country codes used in glosses to more common 2 letter ones.
@@ -19,7 +19,11 @@ class JMdictEntry:
 		self.eid = eid
 		self.senseNbr = senseNbr
 		self.keb = None
+		# All the kanji writings of the entry, keb being the first one
+		self.kebs = []
 		self.reb = None
+		# All the readings of the entry, reb being the first one
+		self.rebs = []
 		self.pri = 0
 		# Group glosses per language, one per line
 		self.translations = {}
@@ -29,6 +33,9 @@ class JMdictEntry:
 	def contextString(self):
 		return '%d %d' % (self.eid, self.senseNbr)
 
+	def shardKey(self):
+		return self.eid
+
 	def sourceString(self):
 		if not self.keb: jp = '%s' % (self.reb,)
 		else: jp = '%s\t%s' % (self.keb, self.reb)
@@ -55,6 +62,9 @@ class JMdictEntry:
 			ret += "%s %s\n" % (self.contextString(), s)
 		return ret
 
+# Numeric fields of entries kept as columns.Columns
+columnFields = ('eid', 'senseNbr', 'pri')
+
 class JMdictParser(xmlhandler.BasicHandler):
 	def __init__(self):
 		xmlhandler.BasicHandler.__init__(self)
@@ -64,14 +74,18 @@ class JMdictParser(xmlhandler.BasicHandler):
 		self.currentLangSense = {}
 		self.currentEid = None
 		self.currentKeb = None
+		self.currentKebs = []
 		self.currentReb = None
+		self.currentRebs = []
 		self.currentPri = 0
 		self.lang = None
 
 	def handle_end_entry(self):
 		self.currentEid = None
 		self.currentKeb = None
+		self.currentKebs = []
 		self.currentReb = None
+		self.currentRebs = []
 		# Current Sense index to be added to pot file
 		self.currentSense = 0
 		# Current sense index per language
@@ -84,10 +98,12 @@ class JMdictParser(xmlhandler.BasicHandler):
 	def handle_data_keb(self, data):
 		if not self.currentKeb:
 			self.currentKeb = data
+		self.currentKebs.append(data)
 
 	def handle_data_reb(self, data):
 		if not self.currentReb:
 			self.currentReb = data
+		self.currentRebs.append(data)
 
 	def handle_data_ke_pri(self, data):
 		if data in ("news1", "ichi1", "spec1", "gail1"): self.currentPri += 100
@@ -100,7 +116,9 @@ class JMdictParser(xmlhandler.BasicHandler):
 	def handle_start_sense(self, attrs):
 		self.currentEntry = JMdictEntry(self.currentEid, self.currentSense)
 		self.currentEntry.keb = self.currentKeb
+		self.currentEntry.kebs = self.currentKebs
 		self.currentEntry.reb = self.currentReb
+		self.currentEntry.rebs = self.currentRebs
 		self.currentEntry.pri = self.currentPri
 		self.firstGloss = True
 
@@ -136,22 +154,38 @@ def parseSrcEntries(src):
 	parser.parse(src)
 	return handler.entries
 
+def readJLPT(level):
+	return [ int(x) for x in filter(lambda l: not l.startswith('#'), open(os.path.join(projectShort, "jlpt-n%d.csv" % (level,))).readlines()[:-1]) ]
+
+# Entry id to JLPT level, the easiest level winning as with the filters
+def jlptLevels():
+	levels = {}
+	for level in (1, 2, 3, 4, 5):
+		for eid in readJLPT(level): levels[eid] = level
+	return levels
+
 class JLPTFilter(efilter.Filter):
 	def __init__(self, level):
 		efilter.Filter.__init__(self, "jlpt%d" % (level,), projectShort, projectDesc, ownerInfo)
-		self.elist = [ int(x) for x in filter(lambda l: not l.startswith('#'), open(os.path.join(projectShort, "jlpt-n%d.csv" % (level,))).readlines()[:-1]) ]
+		self.elist = readJLPT(level)
 
 	def isfiltered(self, entry):
 		return entry.eid in self.elist
 
+	def mask(self, cols):
+		return columns.isin(cols['eid'], self.elist)
+
 class PriFilter(efilter.Filter):
-	def __init__(self, minlevel):
+	def __init__(self, minlevel, shardSize = 0):
 		self.minlevel = minlevel
-		efilter.Filter.__init__(self, "pri%03d" % (minlevel,), projectShort, projectDesc, ownerInfo)
+		efilter.Filter.__init__(self, "pri%03d" % (minlevel,), projectShort, projectDesc, ownerInfo, shardSize)
 
 	def isfiltered(self, entry):
 		return entry.pri > self.minlevel
 
+	def mask(self, cols):
+		return columns.gt(cols['pri'], self.minlevel)
+
 class HasTranslationFilter(efilter.Filter):
 	def __init__(self):
 		efilter.Filter.__init__(self, "trans", projectShort, projectDesc, ownerInfo)
@@ -161,13 +195,22 @@ class HasTranslationFilter(efilter.Filter):
 			if lang in entry.translations: return True
 		return False
 
+	def mask(self, cols):
+		ret = columns.full(len(cols), False)
+		for lang in projectLangs:
+			ret = columns.logicalOr(ret, cols.translated[lang])
+		return ret
+
 class AllFilter(efilter.Filter):
-	def __init__(self):
-		efilter.Filter.__init__(self, "others", projectShort, projectDesc, ownerInfo)
+	def __init__(self, shardSize = 0):
+		efilter.Filter.__init__(self, "others", projectShort, projectDesc, ownerInfo, shardSize)
 
 	def isfiltered(self, entry):
 		return True
 
+	def mask(self, cols):
+		return columns.full(len(cols), True)
+
 def filtersList():
 	filters = []
 	filters.append(JLPTFilter(5))
@@ -179,7 +222,13 @@ def filtersList():
 	filters.append(PriFilter(310))
 	filters.append(PriFilter(220))
 	filters.append(PriFilter(200))
-	filters.append(PriFilter(0))
+	# Catches all the remaining prioritized entries, so split it in shards of at most 2000 entries
+	filters.append(PriFilter(0, 2000))
 	filters.append(HasTranslationFilter())
 	#filters.append(AllFilter())
 	return filters
+
+# Extra outputs written by jmdict-extract.py, returns the number of keys written
+def writeIndexes(entries):
+	words = kanjiindex.build(entries.values(), jlptLevels())
+	return kanjiindex.write(words, os.path.join(projectShort, "kanji-words.idx"))
@@ -6,7 +6,7 @@ ownerInfo = 'Alexandre Courbot <gnurou@gmail.com>'
 txProject = 'kanjidic2-i18n'
 srcFile = 'kanjidic2.xml'
 
-import xmlhandler, xml.sax, efilter
+import xmlhandler, xml.sax, efilter, columns
 from gettextformat import *
 
 # One entry per RMgroup of a kanjidic2 entry
@@ -25,12 +25,18 @@ class Kanjidic2Entry:
 	def contextString(self):
 		return '%s %d' % (self.kanji, self.rmgroup)
 
+	def shardKey(self):
+		return ord(self.kanji[0])
+
 	def sourceString(self):
-		ret = self.kanji + '\n'
+		# Lines are joined rather than terminated, so that entries without meanings do not
+		# end with a newline their translations would have to repeat
+		lines = [ self.kanji ]
 		if len(self.readings) != 0:
-			ret += ', '.join(self.readings) + '\n'
-		ret += self.trString('en')
-		return ret
+			lines.append(', '.join(self.readings))
+		if self.trString('en') != '':
+			lines.append(self.trString('en'))
+		return '\n'.join(lines)
 
 	def trString(self, lang):
 		if not lang in self.translations: return ''
@@ -53,6 +59,9 @@ class Kanjidic2Entry:
 			ret += "%s %s\n" % (self.kanji, s)
 		return ret
 
+# Numeric fields of entries kept as columns.Columns
+columnFields = ('grade', 'freq')
+
 class Kanjidic2Parser(xmlhandler.BasicHandler):
 	def __init__(self):
 		xmlhandler.BasicHandler.__init__(self)
@@ -129,6 +138,9 @@ class GradeFilter(efilter.Filter):
 	def isfiltered(self, entry):
 		return entry.grade > 0 and entry.grade == self.grade
 
+	def mask(self, cols):
+		return columns.logicalAnd(columns.gt(cols['grade'], 0), columns.eq(cols['grade'], self.grade))
+
 class FreqFilter(efilter.Filter):
 	def __init__(self, freq):
 		efilter.Filter.__init__(self, "freq%04d" % (freq,), projectShort, projectDesc, ownerInfo)
@@ -137,13 +149,19 @@ class FreqFilter(efilter.Filter):
 	def isfiltered(self, entry):
 		return entry.freq > 0 and entry.freq <= self.freq
 
+	def mask(self, cols):
+		return columns.logicalAnd(columns.gt(cols['freq'], 0), columns.le(cols['freq'], self.freq))
+
 class AllFilter(efilter.Filter):
-	def __init__(self):
-		efilter.Filter.__init__(self, "others", projectShort, projectDesc, ownerInfo)
+	def __init__(self, shardSize = 0):
+		efilter.Filter.__init__(self, "others", projectShort, projectDesc, ownerInfo, shardSize)
 
 	def isfiltered(self, entry):
 		return True
 
+	def mask(self, cols):
+		return columns.full(len(cols), True)
+
 def filtersList():
 	filters = []
 	filters.append(GradeFilter(1))
@@ -156,5 +174,6 @@ def filtersList():
 	filters.append(FreqFilter(3000))
 	filters.append(GradeFilter(9))
 	filters.append(GradeFilter(10))
-	filters.append(AllFilter())
+	# Catches everything left, so split it in shards of at most 3000 entries
+	filters.append(AllFilter(3000))
 	return filters
@@ -0,0 +1,99 @@
+# Inverted index from kanji to the JMdict entries with a kanji writing (keb) containing them.
+#
+# It gives kanjidic2 consumers the "example words" of a kanji without scanning JMdict. The
+# index is built in one pass over the parsed JMdict entries and written as a compact binary
+# file, all integers little-endian:
+# * header: magic "KJWX", version (uint16), reserved (uint16), number of kanji (uint32)
+# * code points of the indexed kanji, sorted (uint32 each)
+# * offsets of the first word of each kanji, plus the total number of words (uint32 each)
+# * for all words: entry ids (uint32 each), then priorities (uint16 each), then JLPT levels
+#   (uint8 each, 0 if the entry is not part of any JLPT list)
+# Words of a kanji are ranked by decreasing priority, then by entry id.
+
+import struct, array, sys
+
+magic = b'KJWX'
+version = 1
+headerFmt = '<4sHHI'
+
+def isKanji(c):
+	c = ord(c)
+	return 0x4e00 <= c <= 0x9fff or 0x3400 <= c <= 0x4dbf or 0xf900 <= c <= 0xfaff or 0x20000 <= c <= 0x2ffff
+
+def toBytes(a):
+	if sys.byteorder != 'little': a.byteswap()
+	return a.tobytes()
+
+def fromBytes(typecode, data, offset, count):
+	a = array.array(typecode)
+	end = offset + count * a.itemsize
+	a.frombytes(data[offset:end])
+	if sys.byteorder != 'little': a.byteswap()
+	return a, end
+
+def build(entries, jlpt):
+	"""Map each kanji to its (eid, pri, level) words, ranked. entries are JMdict entries, jlpt
+	maps entry ids to their JLPT level."""
+	words = {}
+	seen = set()
+	for entry in entries:
+		if entry.eid in seen or len(entry.kebs) == 0: continue
+		seen.add(entry.eid)
+		word = (entry.eid, min(entry.pri, 0xffff), jlpt.get(entry.eid, 0))
+		for c in set(''.join(entry.kebs)):
+			if isKanji(c): words.setdefault(c, []).append(word)
+	for c in words:
+		words[c].sort(key = lambda w: (-w[1], w[0]))
+	return words
+
+def write(words, path):
+	kanji = sorted(words, key = ord)
+	offsets = array.array('I', [ 0 ])
+	eids = array.array('I')
+	pris = array.array('H')
+	levels = array.array('B')
+	for c in kanji:
+		for eid, pri, level in words[c]:
+			eids.append(eid)
+			pris.append(pri)
+			levels.append(level)
+		offsets.append(len(eids))
+	f = open(path, 'wb')
+	f.write(struct.pack(headerFmt, magic, version, 0, len(kanji)))
+	f.write(toBytes(array.array('I', [ ord(c) for c in kanji ])))
+	for a in (offsets, eids, pris, levels):
+		f.write(toBytes(a))
+	f.close()
+	return len(kanji)
+
+class KanjiIndex:
+	def __init__(self, path):
+		f = open(path, 'rb')
+		data = f.read()
+		f.close()
+		m, v, reserved, nkanji = struct.unpack_from(headerFmt, data)
+		if m != magic or v != version:
+			raise ValueError('%s: not a version %d kanji index' % (path, version))
+		pos = struct.calcsize(headerFmt)
+		codepoints, pos = fromBytes('I', data, pos, nkanji)
+		self.offsets, pos = fromBytes('I', data, pos, nkanji + 1)
+		nwords = self.offsets[-1]
+		self.eids, pos = fromBytes('I', data, pos, nwords)
+		self.pris, pos = fromBytes('H', data, pos, nwords)
+		self.levels, pos = fromBytes('B', data, pos, nwords)
+		self.rows = { chr(c) : i for i, c in enumerate(codepoints) }
+
+	def __contains__(self, kanji):
+		return kanji in self.rows
+
+	def words(self, kanji, level = 0, limit = None):
+		"""Return the (eid, pri, level) words of kanji, best ranked first. If level is given,
+		only words of that JLPT level or an easier one are returned."""
+		if not kanji in self.rows: return []
+		i = self.rows[kanji]
+		ret = []
+		for j in range(self.offsets[i], self.offsets[i + 1]):
+			if level and self.levels[j] < level: continue
+			ret.append((self.eids[j], self.pris[j], self.levels[j]))
+			if limit and len(ret) == limit: break
+		return ret
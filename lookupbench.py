@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# Load test for lookupserver.py on localhost.
+#
+# Lookup paths are sampled from the msgctxt/msgid of the .pot files of the given modules, so
+# the server must serve the same modules. Unless -s points to a running server, one is started
+# for the duration of the test. Requests are sent by a pool of client processes, each keeping
+# its connection alive, and latencies are reported as p50/p99 along with requests/sec.
+
+import sys, os, time, json, random, argparse, subprocess, multiprocessing, http.client, urllib.parse
+from gettextformat import *
+
+def samplePaths(names, count):
+	paths = []
+	for name in names:
+		client = __import__(name)
+		d = client.projectShort
+		for f in sorted(os.listdir(d)):
+			if not f.endswith('.pot'): continue
+			for entry in readPo(open(os.path.join(d, f), 'r', encoding='utf-8')):
+				ctx = entry.contextString().split(' ')
+				word = entry.sourceString().split('\n')[0].split('\t')[0]
+				if d == 'jmdict':
+					paths.append('/jmdict/sense/%s/%s' % (ctx[0], ctx[1]))
+					paths.append('/jmdict/entry/%s' % (ctx[0],))
+					paths.append('/jmdict/word/%s' % (urllib.parse.quote(word),))
+				elif d == 'kanjidic2':
+					paths.append('/kanjidic2/kanji/%s' % (urllib.parse.quote(ctx[0]),))
+	random.shuffle(paths)
+	return paths[:count]
+
+def runClient(args):
+	host, port, requests = args
+	conn = http.client.HTTPConnection(host, port)
+	latencies = []
+	for req in requests:
+		start = time.perf_counter()
+		if isinstance(req, list):
+			conn.request('POST', '/batch', json.dumps(req).encode('utf-8'), { 'Content-Type' : 'application/json' })
+		else:
+			conn.request('GET', req)
+		resp = conn.getresponse()
+		resp.read()
+		latencies.append(time.perf_counter() - start)
+	conn.close()
+	return latencies
+
+def percentile(values, p):
+	return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def getJson(host, port, path):
+	conn = http.client.HTTPConnection(host, port)
+	conn.request('GET', path)
+	ret = json.loads(conn.getresponse().read().decode('utf-8'))
+	conn.close()
+	return ret
+
+if __name__ == "__main__":
+	aparser = argparse.ArgumentParser(description = "Measure the latency and throughput of lookupserver.py.")
+	aparser.add_argument('module',
+		nargs = '+',
+		help = 'Modules served')
+	aparser.add_argument('-s',
+		action = 'store',
+		default = None,
+		help = 'host:port of a running server (default: start one)')
+	aparser.add_argument('-n',
+		action = 'store',
+		type = int,
+		default = 20000,
+		help = 'Number of requests (default: 20000)')
+	aparser.add_argument('-k',
+		action = 'store',
+		type = int,
+		default = 5000,
+		help = 'Number of distinct lookup paths (default: 5000)')
+	aparser.add_argument('-j',
+		action = 'store',
+		type = int,
+		default = 4,
+		help = 'Number of concurrent clients (default: 4)')
+	aparser.add_argument('-b',
+		action = 'store',
+		type = int,
+		default = 0,
+		help = 'Send batches of this many lookups instead of single requests')
+	cmdargs = aparser.parse_args()
+
+	paths = samplePaths(cmdargs.module, cmdargs.k)
+	if len(paths) == 0:
+		print('No lookup paths found, have the modules been extracted?')
+		sys.exit(1)
+	requests = []
+	for i in range(cmdargs.n):
+		if cmdargs.b > 0: requests.append([ random.choice(paths) for j in range(cmdargs.b) ])
+		else: requests.append(random.choice(paths))
+
+	server = None
+	if cmdargs.s:
+		host, port = cmdargs.s.rsplit(':', 1)
+		port = int(port)
+	else:
+		host, port = '127.0.0.1', 18080
+		server = subprocess.Popen([ sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lookupserver.py'), '-p', str(port) ] + cmdargs.module, stdout = subprocess.PIPE, universal_newlines = True)
+		for l in server.stdout:
+			print(l, end = '')
+			if l.startswith('Listening'): break
+
+	try:
+		chunks = [ (host, port, requests[i::cmdargs.j]) for i in range(cmdargs.j) ]
+		pool = multiprocessing.Pool(cmdargs.j)
+		start = time.perf_counter()
+		latencies = sum(pool.map(runClient, chunks), [])
+		elapsed = time.perf_counter() - start
+		pool.close()
+		pool.join()
+		stats = getJson(host, port, '/stats')
+	finally:
+		if server:
+			server.terminate()
+			server.wait()
+
+	latencies.sort()
+	lookups = len(latencies) * max(cmdargs.b, 1)
+	print('%-30s%d (%d lookups)' % ('Requests:', len(latencies), lookups))
+	print('%-30s%.2fs' % ('Elapsed:', elapsed))
+	print('%-30s%.0f' % ('Requests/sec:', len(latencies) / elapsed))
+	print('%-30s%.0f' % ('Lookups/sec:', lookups / elapsed))
+	print('%-30s%.3fms' % ('p50 latency:', percentile(latencies, 50) * 1000))
+	print('%-30s%.3fms' % ('p99 latency:', percentile(latencies, 99) * 1000))
+	print('%-30shits: %d, misses: %d, size: %d' % ('Cache:', stats['hits'], stats['misses'], stats['size']))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# Small HTTP/JSON lookup service over the extraction results of one or more modules.
+#
+# The source file of each module is parsed and the translations of the .po files written by
+# jmdict-extract.py (i.e. the merged translations, fuzzy ones included) are applied on top of
+# it. Entries can then be looked up with:
+# GET  /jmdict/sense/<eid>/<sense>   one sense
+# GET  /jmdict/entry/<eid>           all senses of an entry
+# GET  /jmdict/word/<keb or reb>     all senses of the entries with a writing or reading matching a word
+# GET  /kanjidic2/kanji/<literal>    all meaning groups of a kanji
+# POST /batch                        JSON list of lookup paths, answered with a list of results
+# GET  /stats                        cache statistics
+# Lookups accept ?lang=xx to only return the translations of one language. Responses are kept
+# in an LRU cache.
+
+import sys, os.path, json, argparse, functools, http.server, urllib.parse
+from gettextformat import *
+
+def splitLines(s):
+	if s == '': return []
+	return s.split('\n')
+
+def translationsOf(entry, langs):
+	return { lang : splitLines(entry.translations[lang]) for lang in langs if lang != 'en' and lang in entry.translations }
+
+def jmdictToJson(entry, langs):
+	return { 'eid' : entry.eid, 'sense' : entry.senseNbr, 'keb' : entry.keb, 'reb' : entry.reb, 'kebs' : entry.kebs, 'rebs' : entry.rebs, 'pri' : entry.pri,
+		'gloss' : splitLines(entry.trString('en')), 'translations' : translationsOf(entry, langs),
+		'fuzzy' : [ lang for lang in entry.fuzzies if lang in langs ] }
+
+def kanjidic2ToJson(entry, langs):
+	return { 'literal' : entry.kanji, 'rmgroup' : entry.rmgroup, 'readings' : entry.readings, 'grade' : entry.grade,
+		'freq' : entry.freq, 'meaning' : splitLines(entry.trString('en')), 'translations' : translationsOf(entry, langs),
+		'fuzzy' : [ lang for lang in entry.fuzzies if lang in langs ] }
+
+class ModuleIndex:
+	def __init__(self, client):
+		self.client = client
+		self.entries = client.parseSrcEntries(os.path.join(client.projectShort, client.srcFile))
+		self.mergeTranslations()
+		# Lookup tables, by kind of request, to lists of entries
+		self.tables = {}
+		if client.projectShort == 'jmdict': self.indexJMdict()
+		elif client.projectShort == 'kanjidic2': self.indexKanjidic2()
+
+	def mergeTranslations(self):
+		d = self.client.projectShort
+		for f in sorted(os.listdir(d)):
+			if not f.endswith('.po'): continue
+			for entry in readPo(open(os.path.join(d, f), 'r', encoding='utf-8')):
+				lang = entry.lang
+				if not lang in self.client.projectLangs: break
+				key = entry.contextString()
+				if not key in self.entries or entry.trString(lang) == '': continue
+				srcEntry = self.entries[key]
+				srcEntry.translations[lang] = entry.trString(lang)
+				if entry.fuzzy and not lang in srcEntry.fuzzies: srcEntry.fuzzies.append(lang)
+
+	def add(self, table, key, entry):
+		t = self.tables.setdefault(table, {})
+		l = t.setdefault(key, [])
+		if not entry in l: l.append(entry)
+
+	def indexJMdict(self):
+		self.toJson = jmdictToJson
+		for key in sorted(self.entries, key = lambda k: (self.entries[k].eid, self.entries[k].senseNbr)):
+			entry = self.entries[key]
+			# Some keys alias the sense that received another language's glosses
+			if entry.contextString() != key: continue
+			self.add('sense', '%d/%d' % (entry.eid, entry.senseNbr), entry)
+			self.add('entry', str(entry.eid), entry)
+			for word in entry.kebs + entry.rebs: self.add('word', word, entry)
+
+	def indexKanjidic2(self):
+		self.toJson = kanjidic2ToJson
+		for key in sorted(self.entries):
+			entry = self.entries[key]
+			self.add('kanji', entry.kanji, entry)
+
+	def lookup(self, table, key, langs):
+		if not table in self.tables or not key in self.tables[table]: return None
+		return [ self.toJson(entry, langs) for entry in self.tables[table][key] ]
+
+class LookupServer(http.server.ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, address, modules, cacheSize):
+		http.server.ThreadingHTTPServer.__init__(self, address, LookupHandler)
+		self.modules = modules
+		self.cachedLookup = functools.lru_cache(maxsize = cacheSize)(self.lookup)
+
+	def lookup(self, path):
+		"""Return the HTTP status and JSON body for a lookup path."""
+		url = urllib.parse.urlsplit(path)
+		parts = [ urllib.parse.unquote(p) for p in url.path.strip('/').split('/') ]
+		query = urllib.parse.parse_qs(url.query)
+		if len(parts) < 3 or not parts[0] in self.modules:
+			return 404, json.dumps({ 'error' : 'unknown path %s' % (url.path,) }).encode('utf-8')
+		index = self.modules[parts[0]]
+		langs = ('en',) + tuple(index.client.projectLangs)
+		if 'lang' in query: langs = tuple(query['lang'])
+		res = index.lookup(parts[1], '/'.join(parts[2:]), langs)
+		if res is None:
+			return 404, json.dumps({ 'error' : 'no match for %s' % (url.path,) }).encode('utf-8')
+		return 200, json.dumps(res, ensure_ascii = False).encode('utf-8')
+
+	def stats(self):
+		info = self.cachedLookup.cache_info()
+		return { 'hits' : info.hits, 'misses' : info.misses, 'size' : info.currsize, 'maxsize' : info.maxsize }
+
+class LookupHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	# Headers and body are written separately, which would otherwise wait for delayed ACKs
+	disable_nagle_algorithm = True
+
+	def reply(self, status, body):
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		if self.path == '/stats':
+			self.reply(200, json.dumps(self.server.stats()).encode('utf-8'))
+			return
+		self.reply(*self.server.cachedLookup(self.path))
+
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		if self.path != '/batch':
+			self.reply(404, json.dumps({ 'error' : 'unknown path %s' % (self.path,) }).encode('utf-8'))
+			return
+		try:
+			paths = json.loads(body.decode('utf-8'))
+			if not isinstance(paths, list): raise ValueError('expected a list of paths')
+		except ValueError as e:
+			self.reply(400, json.dumps({ 'error' : str(e) }).encode('utf-8'))
+			return
+		results = [ self.server.cachedLookup(str(path))[1] for path in paths ]
+		self.reply(200, b'[' + b','.join(results) + b']')
+
+	def log_message(self, format, *args):
+		pass
+
+def loadModules(names):
+	modules = {}
+	for name in names:
+		client = __import__(name)
+		print('%-30s' % ('Loading %s...' % (client.srcFile,)), end='')
+		sys.stdout.flush()
+		modules[client.projectShort] = ModuleIndex(client)
+		print('%d entries' % (len(modules[client.projectShort].entries),))
+	return modules
+
+if __name__ == "__main__":
+	aparser = argparse.ArgumentParser(description = "Serve lookups over the extraction results of modules.")
+	aparser.add_argument('module',
+		nargs = '+',
+		help = 'Modules to serve')
+	aparser.add_argument('-a',
+		action = 'store',
+		default = '127.0.0.1',
+		help = 'Address to listen on (default: 127.0.0.1)')
+	aparser.add_argument('-p',
+		action = 'store',
+		type = int,
+		default = 8080,
+		help = 'Port to listen on (default: 8080)')
+	aparser.add_argument('-c',
+		action = 'store',
+		type = int,
+		default = 65536,
+		help = 'Number of responses kept in the LRU cache (default: 65536)')
+	cmdargs = aparser.parse_args()
+
+	server = LookupServer((cmdargs.a, cmdargs.p), loadModules(cmdargs.module), cmdargs.c)
+	print('Listening on %s:%d' % server.server_address[:2])
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# Validate the .pot, .po, .reg and .sug files written by jmdict-extract.py for a module.
+#
+# This replaces the per-file "msgfmt --check" loop and also covers the generated .po and
+# regression files. Each file is parsed strictly (line numbers are kept for reporting) and
+# checked for:
+# * syntax: keyword order, quoting, continuation lines, missing msgid/msgstr
+# * escapes: only the C escapes understood by msgfmt are accepted
+# * header: required fields, UTF-8 charset and a Language matching the file name
+# * duplicate msgctxt
+# * consistency: msgid/msgstr begin and end with a newline together, .pot files have no
+#   translations and every .po entry carries the msgid of its .pot counterpart. Regressions
+#   keep the source string they were translated from, so .reg files are not compared, and
+#   neither are the .sug suggestion files, which are not split per filter.
+#
+# Files are checked in parallel in a process pool. Can be run standalone with the module
+# names as arguments. jmdict-extract.py runs the tasks of moduleTasks() through validate() as
+# its last stage, restricted to the files it has rewritten in watch mode.
+
+import sys, os.path, re, argparse, multiprocessing
+
+keywordRe = re.compile('^(msgctxt|msgid|msgstr) (.*)$')
+headerFieldRe = re.compile('^([A-Za-z-]+): ?(.*)$')
+requiredHeaders = ('Project-Id-Version', 'MIME-Version', 'Content-Type', 'Content-Transfer-Encoding', 'Language')
+validEscapes = { 'n' : '\n', 't' : '\t', '"' : '"', '\\' : '\\', 'r' : '\r', 'a' : '\a', 'b' : '\b', 'f' : '\f', 'v' : '\v' }
+
+class PoError:
+	def __init__(self, path, line, msg):
+		self.path = path
+		self.line = line
+		self.msg = msg
+
+	def __str__(self):
+		return '%s:%d: %s' % (self.path, self.line, self.msg)
+
+class StrictEntry:
+	def __init__(self, line):
+		self.line = line
+		self.msgctxt = None
+		self.msgid = None
+		self.msgstr = None
+		self.fuzzy = False
+
+def unquote(s, path, lineno, errors):
+	if len(s) < 2 or not s.startswith('"') or not s.endswith('"'):
+		errors.append(PoError(path, lineno, 'string is not enclosed in double quotes'))
+		return ''
+	ret = []
+	i = 1
+	end = len(s) - 1
+	while i < end:
+		c = s[i]
+		if c == '"':
+			errors.append(PoError(path, lineno, 'unescaped double quote'))
+		elif c == '\\':
+			if i + 1 >= end:
+				errors.append(PoError(path, lineno, 'dangling backslash at end of string'))
+				break
+			e = s[i + 1]
+			if e in validEscapes:
+				c = validEscapes[e]
+			else:
+				errors.append(PoError(path, lineno, 'invalid escape sequence "\\%s"' % (e,)))
+				c = e
+			i += 1
+		ret.append(c)
+		i += 1
+	return ''.join(ret)
+
+def parseStrict(path):
+	"""Parse a gettext file, returning its entries (header first) and syntax errors."""
+	entries = []
+	errors = []
+	cur = None
+	field = None
+	fuzzy = False
+	f = open(path, 'r', encoding='utf-8')
+	for lineno, l in enumerate(f, 1):
+		l = l.rstrip('\n')
+		if l == '':
+			if cur: entries.append(cur)
+			cur = None
+			field = None
+			continue
+		if l.startswith('#'):
+			if cur and cur.msgid is not None:
+				errors.append(PoError(path, lineno, 'comment inside an entry'))
+			elif l.startswith('#,') and 'fuzzy' in l:
+				fuzzy = True
+			continue
+		match = keywordRe.match(l)
+		if match:
+			kw = match.group(1)
+			s = unquote(match.group(2), path, lineno, errors)
+			# A new msgctxt/msgid after a complete entry starts a new one
+			if kw != 'msgstr' and cur and cur.msgstr is not None:
+				entries.append(cur)
+				cur = None
+			if not cur:
+				cur = StrictEntry(lineno)
+				cur.fuzzy = fuzzy
+				fuzzy = False
+			if kw == 'msgctxt' and (cur.msgctxt is not None or cur.msgid is not None):
+				errors.append(PoError(path, lineno, 'misplaced msgctxt'))
+			elif kw == 'msgid' and cur.msgid is not None:
+				errors.append(PoError(path, lineno, 'duplicate msgid in entry'))
+			elif kw == 'msgstr' and (cur.msgid is None or cur.msgstr is not None):
+				errors.append(PoError(path, lineno, 'misplaced msgstr'))
+			setattr(cur, kw, s)
+			field = kw
+			continue
+		if l.startswith('"'):
+			if field is None:
+				errors.append(PoError(path, lineno, 'string continuation outside of an entry'))
+			else:
+				setattr(cur, field, getattr(cur, field) + unquote(l, path, lineno, errors))
+			continue
+		errors.append(PoError(path, lineno, 'unexpected line'))
+	f.close()
+	if cur: entries.append(cur)
+	for entry in entries:
+		if entry.msgid is None: errors.append(PoError(path, entry.line, 'entry without msgid'))
+		elif entry.msgstr is None: errors.append(PoError(path, entry.line, 'entry without msgstr'))
+	return entries, errors
+
+def checkHeader(path, entries, lang, errors):
+	if len(entries) == 0 or entries[0].msgid != '' or entries[0].msgctxt is not None:
+		errors.append(PoError(path, 1, 'missing header entry'))
+		return
+	header = entries[0]
+	fields = {}
+	for l in (header.msgstr or '').split('\n'):
+		if l == '': continue
+		match = headerFieldRe.match(l)
+		if not match:
+			errors.append(PoError(path, header.line, 'malformed header line "%s"' % (l,)))
+			continue
+		fields[match.group(1)] = match.group(2)
+	for name in requiredHeaders:
+		if not name in fields:
+			errors.append(PoError(path, header.line, 'missing header field "%s"' % (name,)))
+	if 'Content-Type' in fields and not 'charset=UTF-8' in fields['Content-Type']:
+		errors.append(PoError(path, header.line, 'charset is not UTF-8'))
+	if 'Language' in fields and fields['Language'] != lang:
+		errors.append(PoError(path, header.line, 'Language "%s" does not match file name ("%s")' % (fields['Language'], lang)))
+
+# Parsed .pot files, kept per worker process so each one is only read once
+_potCache = {}
+
+def potMsgids(potPath):
+	if not potPath in _potCache:
+		entries, errors = parseStrict(potPath)
+		_potCache[potPath] = { entry.msgctxt : entry.msgid for entry in entries[1:] }
+	return _potCache[potPath]
+
+def validateFile(task):
+	"""Validate one file. task is (path, kind, lang, pot) where kind is 'pot', 'po' or 'reg'
+	and pot is the template a .po file's msgids must agree with."""
+	path, kind, lang, pot = task
+	entries, errors = parseStrict(path)
+	checkHeader(path, entries, lang, errors)
+	ref = None
+	if kind == 'po':
+		if os.path.exists(pot): ref = potMsgids(pot)
+		else: errors.append(PoError(path, 1, 'no template %s' % (pot,)))
+	seen = {}
+	for entry in entries[1:]:
+		if entry.msgid is None or entry.msgstr is None: continue
+		if entry.msgid == '':
+			errors.append(PoError(path, entry.line, 'empty msgid'))
+		if entry.msgctxt is not None:
+			if entry.msgctxt in seen:
+				errors.append(PoError(path, entry.line, 'duplicate msgctxt "%s" (first defined line %d)' % (entry.msgctxt, seen[entry.msgctxt])))
+			else: seen[entry.msgctxt] = entry.line
+		if kind == 'pot':
+			if entry.msgstr != '': errors.append(PoError(path, entry.line, 'translation in template'))
+			continue
+		if entry.msgstr != '':
+			if entry.msgid.startswith('\n') != entry.msgstr.startswith('\n'):
+				errors.append(PoError(path, entry.line, 'msgid and msgstr do not both begin with a newline'))
+			if entry.msgid.endswith('\n') != entry.msgstr.endswith('\n'):
+				errors.append(PoError(path, entry.line, 'msgid and msgstr do not both end with a newline'))
+		if ref is not None:
+			if not entry.msgctxt in ref:
+				errors.append(PoError(path, entry.line, 'msgctxt "%s" not in template' % (entry.msgctxt,)))
+			elif ref[entry.msgctxt] != entry.msgid:
+				errors.append(PoError(path, entry.line, 'msgid of "%s" differs from its template' % (entry.msgctxt,)))
+	return [ (e.path, e.line, str(e)) for e in errors ]
+
+def moduleTasks(client):
+	"""List the validation tasks for the files written for module client."""
+	d = client.projectShort
+	tasks = []
+	for f in sorted(os.listdir(d)):
+		path = os.path.join(d, f)
+		if f.endswith('.pot'):
+			tasks.append((path, 'pot', 'en', None))
+			continue
+		for lang in client.projectLangs:
+			if f.endswith('_%s.po' % (lang,)):
+				pot = os.path.join(d, f[:-len('_%s.po' % (lang,))] + '.pot')
+				tasks.append((path, 'po', lang, pot))
+			elif f in ('%s_%s.reg' % (client.srcFile, lang), '%s_%s.sug' % (client.srcFile, lang)):
+				tasks.append((path, 'reg', lang, None))
+	return tasks
+
+def validate(tasks, jobs = None):
+	"""Run tasks in a process pool, returning the error messages and the number of files checked."""
+	# Biggest files first so that no worker is left alone with a large one at the end
+	tasks = sorted(tasks, key = lambda t: os.path.getsize(t[0]), reverse = True)
+	pool = multiprocessing.Pool(jobs)
+	errors = []
+	for fileErrors in pool.imap_unordered(validateFile, tasks):
+		errors += fileErrors
+	pool.close()
+	pool.join()
+	return [ e[2] for e in sorted(errors) ], len(tasks)
+
+if __name__ == "__main__":
+	aparser = argparse.ArgumentParser(description = "Validate the .pot, .po and .reg files of modules.")
+	aparser.add_argument('module',
+		nargs = '+',
+		help = 'Modules whose files should be validated')
+	aparser.add_argument('-j',
+		action = 'store',
+		type = int,
+		default = None,
+		help = 'Number of worker processes (default: number of CPUs)')
+	cmdargs = aparser.parse_args()
+
+	tasks = []
+	for module in cmdargs.module:
+		tasks += moduleTasks(__import__(module))
+	errors, cpt = validate(tasks, cmdargs.j)
+	for error in errors:
+		print(error)
+	print('%d files checked, %d errors' % (cpt, len(errors)))
+	if len(errors) > 0: sys.exit(1)
@@ -0,0 +1,152 @@
+# Translation memory built from the translated .po entries.
+#
+# Identical or near-identical English glosses are common across entries, so the translation
+# of one is a good suggestion for the others. Sources are normalized (lowercase, collapsed
+# whitespace) and looked up in two ways:
+# * exactly, through a hash table from source to translations
+# * by similarity, through an inverted index of character n-grams. N-grams are taken within
+#   each word, padded with spaces, so the order of glosses does not matter. Similarity is the
+#   Dice coefficient of the n-gram sets. N-grams are ordered from rarest to most common, and
+#   two sets can only reach the threshold if the beginnings ("prefixes") of their ordered
+#   n-grams share one (prefix filtering). Only these prefixes are indexed and looked up, so
+#   the long lists of documents of common n-grams are never walked. Documents whose size or
+#   n-gram positions leave them unable to reach the threshold are skipped before their
+#   similarity is computed (size and positional filtering).
+# Candidates of a source do not depend on the language, so they are computed once per source.
+
+import re, math, bisect
+
+wordRe = re.compile(r'\w+')
+
+def normalize(s):
+	return ' '.join(s.lower().split())
+
+class TranslationMemory:
+	def __init__(self, n = 4, threshold = 0.7):
+		self.n = n
+		self.threshold = threshold
+		# Exact match table, normalized source to document id
+		self.docIds = {}
+		self.sources = []
+		# Per document, language to {translation : count}
+		self.translations = []
+		# Per document, set of n-gram ids
+		self.grams = []
+		self.gramIds = {}
+		# Number of documents containing each n-gram
+		self.df = []
+		# Prefix n-gram to documents, built by buildIndex()
+		self.index = None
+		self.cache = {}
+
+	def gramStrings(self, s):
+		ret = set()
+		for w in wordRe.findall(s):
+			w = ' %s ' % (w,)
+			for i in range(max(1, len(w) - self.n + 1)): ret.add(w[i:i + self.n])
+		return ret
+
+	def add(self, source, lang, translation):
+		s = normalize(source)
+		if s == '' or translation == '': return
+		if not s in self.docIds:
+			docId = len(self.sources)
+			self.docIds[s] = docId
+			self.sources.append(source)
+			self.translations.append({})
+			grams = set()
+			for g in self.gramStrings(s):
+				if not g in self.gramIds:
+					self.gramIds[g] = len(self.gramIds)
+					self.df.append(0)
+				gid = self.gramIds[g]
+				grams.add(gid)
+				self.df[gid] += 1
+			self.grams.append(grams)
+			self.index = None
+			self.cache = {}
+		t = self.translations[self.docIds[s]].setdefault(lang, {})
+		t[translation] = t.get(translation, 0) + 1
+
+	def __len__(self):
+		return len(self.sources)
+
+	def minOverlap(self, n):
+		"""Smallest number of n-grams a set of n n-grams shares with any set similar to it."""
+		t = self.threshold
+		return int(math.ceil(t * n / (2 - t) - 1e-9))
+
+	def ordered(self, grams):
+		"""Sort n-gram ids from rarest to most common. Unknown n-grams (None) come first, as if
+		no document contained them."""
+		return sorted(grams, key = lambda g: (-1, 0) if g is None else (self.df[g], g))
+
+	def prefixLength(self, n):
+		"""Number of rarest n-grams of a set of n n-grams, one of which any similar set contains."""
+		return max(0, n - self.minOverlap(n) + 1)
+
+	def buildIndex(self):
+		"""Index the prefix n-grams of the documents. Each n-gram maps to the sizes, ids and
+		positions in their prefix of its documents, sorted by size so that lookups can skip
+		sizes which cannot be similar."""
+		index = {}
+		for docId, grams in enumerate(self.grams):
+			d = len(grams)
+			for pos, g in enumerate(self.ordered(grams)[:self.prefixLength(d)]):
+				index.setdefault(g, []).append((d, docId, pos))
+		self.index = {}
+		for g, docs in index.items():
+			docs.sort()
+			self.index[g] = tuple([ doc[i] for doc in docs ] for i in range(3))
+
+	def candidates(self, s):
+		"""Return the (score, document id) of the documents similar to normalized source s, best first."""
+		if s in self.cache: return self.cache[s]
+		ret = []
+		exact = self.docIds.get(s)
+		if exact is not None: ret.append((1.0, exact))
+		if self.index is None: self.buildIndex()
+		strings = self.gramStrings(s)
+		q = len(strings)
+		grams = { self.gramIds[g] for g in strings if g in self.gramIds }
+		ordered = self.ordered(list(grams) + [ None ] * (q - len(grams)))
+		# Sizes of the sets which can be similar to the query
+		t = self.threshold
+		minSize = self.minOverlap(q)
+		maxSize = int(math.floor((2 - t) * q / t + 1e-9))
+		# Shared prefix n-grams per document, or -1 once the n-grams left after the current
+		# positions cannot make up the overlap needed
+		shared = {}
+		for qpos, g in enumerate(ordered[:self.prefixLength(q)]):
+			if not g in self.index: continue
+			sizes, docIds, positions = self.index[g]
+			left = q - qpos - 1
+			for i in range(bisect.bisect_left(sizes, minSize), bisect.bisect_right(sizes, maxSize)):
+				docId = docIds[i]
+				c = shared.get(docId, 0)
+				if c < 0: continue
+				d = sizes[i]
+				if 2 * (c + 1 + min(left, d - positions[i] - 1)) >= t * (q + d) - 1e-9: shared[docId] = c + 1
+				else: shared[docId] = -1
+		shared.pop(exact, None)
+		for docId, c in shared.items():
+			if c < 0: continue
+			dgrams = self.grams[docId]
+			score = 2.0 * len(grams & dgrams) / (q + len(dgrams))
+			if score >= t: ret.append((score, docId))
+		# Ties are broken by source rather than by document id, so that the ranking does not
+		# depend on the order in which documents were added
+		ret.sort(key = lambda c: (-c[0], self.sources[c[1]]))
+		self.cache[s] = ret
+		return ret
+
+	def suggest(self, source, lang, limit = 3):
+		"""Return up to limit (score, translation, source) suggestions for source in lang."""
+		ret = []
+		for score, docId in self.candidates(normalize(source)):
+			if not lang in self.translations[docId]: continue
+			t = self.translations[docId][lang]
+			best = sorted(t, key = lambda tr: (-t[tr], tr))[0]
+			ret.append((score, best, self.sources[docId]))
+			if len(ret) == limit: break
+		return ret
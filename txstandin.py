@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# Local stand-in for the part of the Transifex API v3 used by txsync.py.
+#
+# Resources are kept in memory, optionally seeded with the source and translation files of
+# the .tx/config of a checkout (-s). Resources of legacy "<project>.<resource>" sections are
+# put in the organization given with -o. Each upload bumps the last update time of what it
+# replaces. Every project exists, so that resources can be created in any of them.
+# Asynchronous jobs are done as soon as they are created, their first poll returns the
+# result. The following requests are served, authentication is ignored:
+# GET  /organizations                                 the organization of -o
+# GET  /projects/<project id>                         a project
+# GET  /resources/<resource id>                       a resource
+# POST /resources                                     create a resource
+# GET  /resource_language_stats?filter[resource]=<id> last update time per language
+# POST /resource_strings_async_uploads                replace the source file
+# POST /resource_translations_async_uploads           replace a translation file
+# POST /resource_strings_async_downloads              prepare the source file
+# POST /resource_translations_async_downloads         prepare a translation file
+# GET  /<job type>/<job id>                           status of a job, downloads redirect to
+# GET  /standin/files/<job id>                        the prepared file
+# GET  /standin/stats                                 number of requests per method and connections
+# -l adds a delay to every request, to emulate the round trip to the real server.
+
+import sys, os, json, time, argparse, datetime, threading, http.server, urllib.parse
+import txsync
+
+jobKinds = ('resource_strings_async_uploads', 'resource_translations_async_uploads',
+	'resource_strings_async_downloads', 'resource_translations_async_downloads')
+
+class StandinServer(http.server.ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, address, latency, organization):
+		http.server.ThreadingHTTPServer.__init__(self, address, StandinHandler)
+		self.latency = latency
+		self.organization = organization
+		self.lock = threading.Lock()
+		# Resource id to { lang : [ content, last update ] }, the source under its language
+		self.resources = {}
+		self.sourceLangs = {}
+		# Job id to the (kind, resource id, lang) of download jobs, None for upload jobs
+		self.jobs = {}
+		self.requests = {}
+		self.connections = 0
+
+	def now(self):
+		return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+	def resourceId(self, resource):
+		return 'o:%s:p:%s:r:%s' % (resource.organization or self.organization, resource.project, resource.slug)
+
+	def seed(self, directory):
+		"""Load the resources of the .tx/config of directory."""
+		host, resources = txsync.readConfig(os.path.join(directory, '.tx', 'config'))
+		cpt = 0
+		for resource in resources:
+			path = os.path.join(directory, resource.sourceFile)
+			if not os.path.exists(path): continue
+			key = self.resourceId(resource)
+			self.sourceLangs[key] = resource.sourceLang
+			self.resources[key] = { resource.sourceLang : [ open(path, 'r', encoding='utf-8').read(), self.now() ] }
+			for lang in resource.localLangs(directory):
+				path = os.path.join(directory, resource.translationFile(lang))
+				self.resources[key][lang] = [ open(path, 'r', encoding='utf-8').read(), self.now() ]
+				cpt += 1
+		return len(self.resources), cpt
+
+	def newJob(self, kind, job):
+		jobId = '%08x' % (len(self.jobs),)
+		self.jobs[jobId] = job
+		return 202, { 'data' : { 'type' : kind, 'id' : jobId, 'attributes' : { 'status' : 'pending' } } }
+
+	def job(self, kind, payload):
+		"""Create a job from a JSON:API payload."""
+		relationships = payload['data']['relationships']
+		key = relationships['resource']['data']['id']
+		if not key in self.resources: return 404, error('no such resource')
+		res = self.resources[key]
+		lang = self.sourceLangs[key]
+		if 'language' in relationships: lang = relationships['language']['data']['id'][2:]
+		if kind.endswith('_downloads'):
+			if not lang in res: return 404, error('no such language')
+			return self.newJob(kind, (kind, key, lang))
+		content = payload['data']['attributes']['content']
+		if not lang in res or res[lang][0] != content:
+			res[lang] = [ content, self.now() ]
+		return self.newJob(kind, None)
+
+	def handle(self, method, parts, query, payload):
+		"""Return the HTTP status, reply and extra headers of an API request. Replies are
+		encoded as JSON, except bytes which are sent as they are."""
+		with self.lock:
+			self.requests[method] = self.requests.get(method, 0) + 1
+			if parts == [ 'standin', 'stats' ]:
+				return 200, { 'requests' : self.requests, 'connections' : self.connections }, {}
+			if len(parts) == 3 and parts[:2] == [ 'standin', 'files' ] and self.jobs.get(parts[2]) is not None:
+				kind, key, lang = self.jobs[parts[2]]
+				return 200, self.resources[key][lang][0].encode('utf-8'), {}
+			if method == 'GET' and parts == [ 'organizations' ]:
+				org = { 'type' : 'organizations', 'id' : 'o:' + self.organization, 'attributes' : { 'slug' : self.organization } }
+				return 200, { 'data' : [ org ], 'links' : { 'next' : None } }, {}
+			if method == 'GET' and len(parts) == 2 and parts[0] == 'projects':
+				return 200, { 'data' : { 'type' : 'projects', 'id' : parts[1] } }, {}
+			if len(parts) == 2 and parts[0] == 'resources' and method == 'GET':
+				if not parts[1] in self.resources: return 404, error('no such resource'), {}
+				return 200, { 'data' : { 'type' : 'resources', 'id' : parts[1] } }, {}
+			if parts == [ 'resources' ] and method == 'POST':
+				data = payload['data']
+				key = '%s:r:%s' % (data['relationships']['project']['data']['id'], data['attributes']['slug'])
+				if key in self.resources: return 409, error('resource exists'), {}
+				self.sourceLangs[key] = 'en'
+				self.resources[key] = {}
+				return 201, { 'data' : { 'type' : 'resources', 'id' : key } }, {}
+			if parts == [ 'resource_language_stats' ] and method == 'GET':
+				key = query.get('filter[resource]', [ '' ])[0]
+				if not key in self.resources: return 404, error('no such resource'), {}
+				res = self.resources[key]
+				stats = [ { 'type' : 'resource_language_stats', 'id' : '%s:l:%s' % (key, lang),
+					'attributes' : { 'last_update' : res[lang][1] } } for lang in sorted(res) ]
+				return 200, { 'data' : stats, 'links' : { 'next' : None } }, {}
+			if len(parts) == 1 and parts[0] in jobKinds and method == 'POST':
+				status, reply = self.job(parts[0], payload)
+				return status, reply, {}
+			if len(parts) == 2 and parts[0] in jobKinds and method == 'GET':
+				if not parts[1] in self.jobs: return 404, error('no such job'), {}
+				if self.jobs[parts[1]] is None:
+					return 200, { 'data' : { 'type' : parts[0], 'id' : parts[1], 'attributes' : { 'status' : 'succeeded' } } }, {}
+				return 303, {}, { 'Location' : '/standin/files/' + parts[1] }
+			return 404, error('unknown path'), {}
+
+def error(detail):
+	return { 'errors' : [ { 'detail' : detail } ] }
+
+class StandinHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	disable_nagle_algorithm = True
+
+	def setup(self):
+		http.server.BaseHTTPRequestHandler.setup(self)
+		with self.server.lock: self.server.connections += 1
+
+	def serve(self, method):
+		payload = None
+		length = int(self.headers.get('Content-Length', 0))
+		if length > 0: payload = json.loads(self.rfile.read(length).decode('utf-8'))
+		if self.server.latency: time.sleep(self.server.latency)
+		u = urllib.parse.urlsplit(self.path)
+		parts = [ p for p in u.path.split('/') if p != '' ]
+		status, reply, headers = self.server.handle(method, parts, urllib.parse.parse_qs(u.query), payload)
+		if isinstance(reply, bytes):
+			body = reply
+			contentType = 'application/octet-stream'
+		else:
+			body = json.dumps(reply, ensure_ascii = False).encode('utf-8')
+			contentType = 'application/vnd.api+json'
+		self.send_response(status)
+		self.send_header('Content-Type', contentType)
+		self.send_header('Content-Length', str(len(body)))
+		for name, value in headers.items():
+			# Redirections are absolute, as those of the real server
+			if name == 'Location': value = 'http://%s%s' % (self.headers.get('Host'), value)
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		self.serve('GET')
+
+	def do_POST(self):
+		self.serve('POST')
+
+	def log_message(self, format, *args):
+		pass
+
+if __name__ == "__main__":
+	aparser = argparse.ArgumentParser(description = "Serve a local stand-in of the Transifex API used by txsync.py.")
+	aparser.add_argument('-a',
+		action = 'store',
+		default = '127.0.0.1',
+		help = 'Address to listen on (default: 127.0.0.1)')
+	aparser.add_argument('-p',
+		action = 'store',
+		type = int,
+		default = 8090,
+		help = 'Port to listen on (default: 8090)')
+	aparser.add_argument('-o',
+		action = 'store',
+		default = 'standin',
+		help = 'Organization of the legacy project.resource sections (default: standin)')
+	aparser.add_argument('-s',
+		action = 'store',
+		default = None,
+		metavar = 'DIR',
+		help = 'Seed the resources with the files of the .tx/config of DIR')
+	aparser.add_argument('-l',
+		action = 'store',
+		type = float,
+		default = 0,
+		help = 'Delay added to every request, in seconds (default: 0)')
+	cmdargs = aparser.parse_args()
+
+	server = StandinServer((cmdargs.a, cmdargs.p), cmdargs.l, cmdargs.o)
+	if cmdargs.s:
+		print('%d resources, %d translations loaded' % server.seed(cmdargs.s))
+	print('Listening on %s:%d' % server.server_address[:2])
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+
+# Synchronize the resources of .tx/config with Transifex, replacing "tx pull" and "tx push".
+#
+# Transfers run concurrently on a bounded pool of threads, each request borrowing one of a
+# pool of persistent HTTP connections. The content hash of every file is recorded in
+# .tx/sync-state.json once the server is known to hold it, i.e. after it has been pushed or
+# pulled, and transfers which would not change anything are skipped:
+# * a source or translation file is not pushed if its hash is the recorded one
+# * a file is not pulled if it still has the recorded hash and the server reports the same
+#   last update time as when it was recorded. One stats request per resource gives the
+#   update times of all its languages.
+# --force transfers everything regardless of the recorded state.
+# Resources missing from the server are reported by pull without failing: pushing their source
+# creates them.
+#
+# The server is reached through a backend object implementing stats(), download() and
+# upload(). TransifexBackend speaks the Transifex API v3 (JSON:API, at rest_hostname), where
+# files are transferred by asynchronous jobs: a job is created, then polled until it is done.
+# Resources are identified by their organization, project and slug. Sections of .tx/config
+# named "o:<organization>:p:<project>:r:<resource>" give all three, the organization of the
+# legacy "<project>.<resource>" sections is given with -o, or looked up among those of the
+# user. --host points the backend to another server, such as the local stand-in of
+# txstandin.py.
+
+import sys, os, glob, json, time, hashlib, argparse, configparser, threading, queue
+import concurrent.futures, http.client, urllib.parse
+
+stateFile = os.path.join('.tx', 'sync-state.json')
+defaultHost = 'https://rest.api.transifex.com'
+
+class SyncError(Exception):
+	pass
+
+class Resource:
+	def __init__(self, organization, project, slug, section):
+		self.organization = organization
+		self.project = project
+		self.slug = slug
+		self.fileFilter = section['file_filter']
+		self.sourceFile = section['source_file']
+		self.sourceLang = section.get('source_lang', 'en')
+		self.type = section.get('type', 'PO')
+
+	def name(self):
+		return '%s.%s' % (self.project, self.slug)
+
+	def translationFile(self, lang):
+		return self.fileFilter.replace('<lang>', lang)
+
+	def localLangs(self, directory = '.'):
+		"""Languages of the translation files present in directory."""
+		prefix, suffix = self.fileFilter.split('<lang>')
+		prefix = os.path.join(directory, prefix)
+		langs = []
+		for path in glob.glob(glob.escape(prefix) + '*' + glob.escape(suffix)):
+			lang = path[len(prefix):len(path) - len(suffix)]
+			if lang != '' and not os.sep in lang: langs.append(lang)
+		return sorted(langs)
+
+def readConfig(path):
+	"""Return the API host and the resources of a .tx/config file."""
+	config = configparser.ConfigParser()
+	config.optionxform = str
+	config.read(path)
+	host = config.get('main', 'rest_hostname', fallback = defaultHost)
+	resources = []
+	for section in config.sections():
+		if section == 'main': continue
+		parts = section.split(':')
+		if len(parts) == 6 and parts[0::2] == [ 'o', 'p', 'r' ]:
+			resources.append(Resource(parts[1], parts[3], parts[5], config[section]))
+		else:
+			project, slug = section.split('.', 1)
+			resources.append(Resource(None, project, slug, config[section]))
+	return host, resources
+
+def readCredentials(host):
+	"""Return the API token of host from $TX_TOKEN, or from ~/.transifexrc."""
+	if 'TX_TOKEN' in os.environ: return os.environ['TX_TOKEN']
+	rc = configparser.ConfigParser()
+	rc.read(os.path.expanduser('~/.transifexrc'))
+	for section in rc.sections():
+		if rc.get(section, 'rest_hostname', fallback = defaultHost).rstrip('/') != host.rstrip('/'): continue
+		# Files written for API v2 keep the token as the password of the "api" user
+		token = rc.get(section, 'token', fallback = '') or rc.get(section, 'password', fallback = '')
+		if token: return token
+	return None
+
+def contentHash(data):
+	return hashlib.sha1(data).hexdigest()
+
+class ConnectionPool:
+	"""Keep-alive HTTP(S) connections to one server, at most size of them."""
+	def __init__(self, url, size, timeout = 60):
+		u = urllib.parse.urlsplit(url)
+		if u.scheme == 'https': self.connClass = http.client.HTTPSConnection
+		else: self.connClass = http.client.HTTPConnection
+		self.host = u.hostname
+		self.port = u.port
+		self.basePath = u.path.rstrip('/')
+		self.timeout = timeout
+		self.idle = queue.LifoQueue()
+		self.slots = threading.BoundedSemaphore(size)
+		self.lock = threading.Lock()
+		self.opened = 0
+
+	def request(self, method, path, body = None, headers = {}):
+		"""Send a request and return (status, headers, body). A connection the server closed
+		while it was idle is reopened once."""
+		self.slots.acquire()
+		try:
+			for attempt in (0, 1):
+				try:
+					conn = self.idle.get_nowait()
+					reused = True
+				except queue.Empty:
+					conn = self.connClass(self.host, self.port, timeout = self.timeout)
+					with self.lock: self.opened += 1
+					reused = False
+				try:
+					conn.request(method, self.basePath + path, body, headers)
+					resp = conn.getresponse()
+					data = resp.read()
+				except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+					conn.close()
+					if reused and attempt == 0: continue
+					raise
+				except Exception:
+					conn.close()
+					raise
+				if resp.will_close: conn.close()
+				else: self.idle.put(conn)
+				return resp.status, resp.headers, data
+		finally:
+			self.slots.release()
+
+	def close(self):
+		while True:
+			try: self.idle.get_nowait().close()
+			except queue.Empty: break
+
+class TransifexBackend:
+	"""Transifex API v3, over a ConnectionPool."""
+	def __init__(self, host, size, token = None, organization = None, retries = 3, timeout = 600):
+		self.pool = ConnectionPool(host, size)
+		self.size = size
+		# Downloaded files are served from other hosts, "<scheme>://<host>" to their pool
+		self.filePools = {}
+		self.headers = { 'Content-Type' : 'application/vnd.api+json', 'Accept' : 'application/vnd.api+json' }
+		if token: self.headers['Authorization'] = 'Bearer ' + token
+		self.organization = organization
+		self.retries = retries
+		# Longest wait for an asynchronous job, in seconds
+		self.timeout = timeout
+		# Project slug to project id, for the resources without an organization
+		self.projects = {}
+		self.lock = threading.Lock()
+
+	def request(self, method, path, payload = None):
+		body = None
+		if payload is not None: body = json.dumps(payload).encode('utf-8')
+		for attempt in range(self.retries + 1):
+			status, headers, data = self.pool.request(method, path, body, self.headers)
+			# Throttled or server error, back off and retry
+			if (status == 429 or status >= 500) and attempt < self.retries:
+				delay = 2 ** attempt
+				if headers.get('Retry-After', '').isdigit(): delay = int(headers['Retry-After'])
+				time.sleep(delay)
+				continue
+			break
+		if status >= 400 and status != 404:
+			raise SyncError('%s %s: HTTP %d %s' % (method, path, status, data[:200].decode('utf-8', 'replace')))
+		return status, headers, data
+
+	def call(self, method, path, payload = None):
+		"""Send a request and return its decoded reply, or None if what it refers to does not exist."""
+		status, headers, data = self.request(method, path, payload)
+		if status == 404: return None
+		if len(data) == 0: return {}
+		return json.loads(data.decode('utf-8'))
+
+	def listAll(self, path):
+		"""Return the objects of all the pages of a collection."""
+		ret = []
+		while path:
+			reply = self.call('GET', path)
+			if reply is None: return None
+			ret += reply['data']
+			path = reply.get('links', {}).get('next')
+			if path:
+				u = urllib.parse.urlsplit(path)
+				path = u.path[len(self.pool.basePath):] + ('?' + u.query if u.query else '')
+		return ret
+
+	def projectId(self, resource):
+		if resource.organization: return 'o:%s:p:%s' % (resource.organization, resource.project)
+		if self.organization: return 'o:%s:p:%s' % (self.organization, resource.project)
+		with self.lock:
+			if not resource.project in self.projects:
+				self.projects[resource.project] = None
+				for org in self.listAll('/organizations') or []:
+					pid = 'o:%s:p:%s' % (org['attributes']['slug'], resource.project)
+					if self.call('GET', '/projects/' + pid) is not None:
+						self.projects[resource.project] = pid
+						break
+			if self.projects[resource.project] is None:
+				raise SyncError('project %s not found in the organizations of the user' % (resource.project,))
+			return self.projects[resource.project]
+
+	def resourceId(self, resource):
+		return '%s:r:%s' % (self.projectId(resource), resource.slug)
+
+	def stats(self, resource):
+		"""Return the last update time of each language of resource, or None if the resource
+		does not exist."""
+		rid = self.resourceId(resource)
+		query = urllib.parse.urlencode({ 'filter[project]' : self.projectId(resource), 'filter[resource]' : rid })
+		ret = self.listAll('/resource_language_stats?' + query)
+		if not ret: return None
+		# Ids are "<resource id>:l:<lang>"
+		stats = { s['id'][len(rid) + 3:] : s['attributes'].get('last_update') for s in ret }
+		# Without an update time, the source is always pulled
+		stats.setdefault(resource.sourceLang, None)
+		return stats
+
+	def startJob(self, kind, attributes, resource, lang):
+		"""Create an asynchronous job of kind on the file of lang of resource. Returns the id of
+		the job, or None if the resource does not exist."""
+		relationships = { 'resource' : { 'data' : { 'type' : 'resources', 'id' : self.resourceId(resource) } } }
+		if lang != resource.sourceLang:
+			relationships['language'] = { 'data' : { 'type' : 'languages', 'id' : 'l:' + lang } }
+		payload = { 'data' : { 'type' : kind, 'attributes' : attributes, 'relationships' : relationships } }
+		ret = self.call('POST', '/' + kind, payload)
+		if ret is None: return None
+		return ret['data']['id']
+
+	def waitJob(self, kind, jobId):
+		"""Poll a job until it is done. Returns the URL a download job redirects to, None for
+		other jobs."""
+		deadline = time.time() + self.timeout
+		delay = 0.5
+		while True:
+			status, headers, data = self.request('GET', '/%s/%s' % (kind, jobId))
+			if status == 303: return headers['Location']
+			if status == 404: raise SyncError('job %s disappeared' % (jobId,))
+			attributes = json.loads(data.decode('utf-8'))['data']['attributes']
+			if attributes['status'] == 'succeeded': return None
+			if attributes['status'] == 'failed':
+				raise SyncError('; '.join([ e.get('detail', '') for e in attributes.get('errors', []) ]) or 'job failed')
+			if time.time() > deadline: raise SyncError('job %s timed out' % (jobId,))
+			time.sleep(delay)
+			delay = min(delay * 1.5, 5)
+
+	def download(self, resource, lang):
+		attributes = { 'content_encoding' : 'text', 'file_type' : 'default' }
+		if lang == resource.sourceLang: kind = 'resource_strings_async_downloads'
+		else:
+			kind = 'resource_translations_async_downloads'
+			attributes['mode'] = 'default'
+		jobId = self.startJob(kind, attributes, resource, lang)
+		if jobId is None: raise SyncError('no content')
+		url = self.waitJob(kind, jobId)
+		if url is None: raise SyncError('no file to download')
+		# The file is served from a separate URL, which takes no API credentials
+		u = urllib.parse.urlsplit(url)
+		origin = '%s://%s' % (u.scheme, u.netloc)
+		with self.lock:
+			if not origin in self.filePools: self.filePools[origin] = ConnectionPool(origin, self.size)
+			pool = self.filePools[origin]
+		status, headers, data = pool.request('GET', u.path + ('?' + u.query if u.query else ''))
+		if status != 200:
+			raise SyncError('GET %s: HTTP %d' % (u.path, status))
+		return data
+
+	def upload(self, resource, lang, data):
+		attributes = { 'content' : data.decode('utf-8'), 'content_encoding' : 'text' }
+		if lang == resource.sourceLang: kind = 'resource_strings_async_uploads'
+		else:
+			kind = 'resource_translations_async_uploads'
+			attributes['file_type'] = 'default'
+		jobId = self.startJob(kind, attributes, resource, lang)
+		if jobId is None:
+			if lang != resource.sourceLang:
+				raise SyncError('resource does not exist, push its source first')
+			# New resource
+			payload = { 'data' : { 'type' : 'resources',
+				'attributes' : { 'slug' : resource.slug, 'name' : resource.slug },
+				'relationships' : {
+					'project' : { 'data' : { 'type' : 'projects', 'id' : self.projectId(resource) } },
+					'i18n_format' : { 'data' : { 'type' : 'i18n_formats', 'id' : resource.type } } } } }
+			if self.call('POST', '/resources', payload) is None:
+				raise SyncError('project does not exist')
+			jobId = self.startJob(kind, attributes, resource, lang)
+			if jobId is None: raise SyncError('resource creation failed')
+		self.waitJob(kind, jobId)
+
+	def opened(self):
+		"""Number of connections opened to all the servers."""
+		return self.pool.opened + sum([ pool.opened for pool in self.filePools.values() ])
+
+	def close(self):
+		self.pool.close()
+		for pool in self.filePools.values(): pool.close()
+
+class Sync:
+	def __init__(self, backend, resources, jobs, force = False, statePath = stateFile):
+		self.backend = backend
+		self.resources = resources
+		# Recorded state is kept for all the configured resources, even if only some are synced
+		self.configured = { r.name() for r in resources }
+		self.jobs = jobs
+		self.force = force
+		self.statePath = statePath
+		# "<project>.<resource> <lang>" to { 'hash' : ..., 'updated' : ... }
+		self.state = {}
+		if os.path.exists(statePath): self.state = json.load(open(statePath, 'r', encoding='utf-8'))
+		self.lock = threading.Lock()
+		self.counts = { 'pushed' : 0, 'pulled' : 0, 'skipped' : 0 }
+		self.errors = []
+		# Problems which do not make the sync fail
+		self.warnings = []
+
+	def key(self, resource, lang):
+		return '%s %s' % (resource.name(), lang)
+
+	def record(self, resource, lang, data, updated):
+		with self.lock:
+			self.state[self.key(resource, lang)] = { 'hash' : contentHash(data), 'updated' : updated }
+
+	def count(self, what):
+		with self.lock: self.counts[what] += 1
+
+	def saveState(self):
+		# Drop the resources which have been removed from the configuration
+		state = { k : v for k, v in self.state.items() if k.split(' ')[0] in self.configured }
+		f = open(self.statePath, 'w', encoding='utf-8')
+		json.dump(state, f, indent = 1, sort_keys = True)
+		f.close()
+
+	def run(self, tasks):
+		"""Run the (function, arguments) tasks on the thread pool. Returns the results of the
+		successful ones, errors are collected in self.errors."""
+		results = []
+		executor = concurrent.futures.ThreadPoolExecutor(self.jobs)
+		futures = { executor.submit(func, *args) : args for func, args in tasks }
+		for future in concurrent.futures.as_completed(futures):
+			try:
+				results.append(future.result())
+			except (SyncError, OSError, http.client.HTTPException, ValueError, KeyError) as e:
+				args = futures[future]
+				self.errors.append('%s: %s' % (' '.join([ args[0].name() ] + list(args[1:2])), e))
+		executor.shutdown()
+		return results
+
+	def pushFile(self, resource, lang, path):
+		data = open(path, 'rb').read()
+		entry = self.state.get(self.key(resource, lang))
+		if not self.force and entry and entry['hash'] == contentHash(data):
+			self.count('skipped')
+			return
+		self.backend.upload(resource, lang, data)
+		# The update time the server now reports is unknown, the next pull will fetch the file
+		self.record(resource, lang, data, None)
+		self.count('pushed')
+
+	def push(self, source, translations):
+		tasks = []
+		for resource in self.resources:
+			if source: tasks.append((self.pushFile, (resource, resource.sourceLang, resource.sourceFile)))
+		# Sources first, so that new resources exist before their translations are pushed
+		self.run(tasks)
+		tasks = []
+		for resource in self.resources:
+			if not translations: break
+			for lang in resource.localLangs():
+				tasks.append((self.pushFile, (resource, lang, resource.translationFile(lang))))
+		self.run(tasks)
+
+	def pullFile(self, resource, lang, path, updated):
+		entry = self.state.get(self.key(resource, lang))
+		if not self.force and entry and updated is not None and entry['updated'] == updated and os.path.exists(path):
+			if entry['hash'] == contentHash(open(path, 'rb').read()):
+				self.count('skipped')
+				return
+		data = self.backend.download(resource, lang)
+		d = os.path.dirname(path)
+		if d and not os.path.exists(d): os.makedirs(d)
+		f = open(path, 'wb')
+		f.write(data)
+		f.close()
+		self.record(resource, lang, data, updated)
+		self.count('pulled')
+
+	def stats(self, resource):
+		return resource, self.backend.stats(resource)
+
+	def pull(self, source, translations):
+		tasks = []
+		for resource, stats in self.run([ (self.stats, (resource,)) for resource in self.resources ]):
+			# Resources are created by pushing their source, which comes after a pull in
+			# update_all: one that is missing must not stop it
+			if stats is None:
+				self.warnings.append('%s: resource does not exist, skipped' % (resource.name(),))
+				continue
+			for lang in sorted(stats):
+				if lang == resource.sourceLang:
+					if source: tasks.append((self.pullFile, (resource, lang, resource.sourceFile, stats[lang])))
+				elif translations:
+					tasks.append((self.pullFile, (resource, lang, resource.translationFile(lang), stats[lang])))
+		self.run(tasks)
+
+if __name__ == "__main__":
+	aparser = argparse.ArgumentParser(description = "Push or pull the resources of .tx/config to or from Transifex.")
+	aparser.add_argument('action',
+		choices = [ 'push', 'pull' ],
+		help = 'Direction of the transfer')
+	aparser.add_argument('-s', '--source',
+		action = 'store_true',
+		help = 'Transfer the source files')
+	aparser.add_argument('-t', '--translations',
+		action = 'store_true',
+		help = 'Transfer the translation files (default for pull)')
+	aparser.add_argument('-f', '--force',
+		action = 'store_true',
+		help = 'Transfer all files, even those which have not changed since the last sync')
+	aparser.add_argument('--skip',
+		action = 'store_true',
+		help = 'Report errors but exit successfully')
+	aparser.add_argument('-j',
+		action = 'store',
+		type = int,
+		default = 8,
+		help = 'Number of concurrent transfers (default: 8)')
+	aparser.add_argument('-r',
+		action = 'append',
+		default = None,
+		metavar = 'RESOURCE',
+		help = 'Only transfer this project.resource (can be repeated)')
+	aparser.add_argument('-o', '--organization',
+		action = 'store',
+		default = None,
+		help = 'Organization of the project.resource sections (default: looked up among those of the user)')
+	aparser.add_argument('--host',
+		action = 'store',
+		default = None,
+		help = 'Server to use instead of the one of .tx/config, e.g. a txstandin.py instance')
+	cmdargs = aparser.parse_args()
+
+	if not os.path.exists(os.path.join('.tx', 'config')):
+		print('No .tx/config in the current directory')
+		sys.exit(1)
+	host, resources = readConfig(os.path.join('.tx', 'config'))
+	if cmdargs.host: host = cmdargs.host
+	translations = cmdargs.translations or (cmdargs.action == 'pull' and not cmdargs.source)
+
+	backend = TransifexBackend(host, cmdargs.j, readCredentials(host), cmdargs.organization)
+	sync = Sync(backend, resources, cmdargs.j, cmdargs.force)
+	if cmdargs.r is not None: sync.resources = [ r for r in resources if r.name() in cmdargs.r ]
+	start = time.time()
+	try:
+		if cmdargs.action == 'push': sync.push(cmdargs.source, translations)
+		else: sync.pull(cmdargs.source, translations)
+	finally:
+		sync.saveState()
+		backend.close()
+	print('%d resources, %d files %s, %d unchanged, %d errors in %.2fs (%d connections)' % (len(sync.resources),
+		sync.counts[cmdargs.action + 'ed'], cmdargs.action + 'ed', sync.counts['skipped'], len(sync.errors),
+		time.time() - start, backend.opened()))
+	for warning in sorted(sync.warnings): print('warning: ' + warning)
+	for error in sorted(sync.errors): print(error)
+	if len(sync.errors) > 0 and not cmdargs.skip: sys.exit(1)